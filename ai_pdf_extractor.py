@@ -1,10 +1,12 @@
 import pdfplumber
-import openpyxl
 import os
 import logging
 import ollama
 import json
 import re
+from categorization_cache import CategorizationCache
+from ingest_manifest import IngestManifest, default_manifest_path
+from transaction_store import RAW, StoreSink, TransactionStore
 
 # Setup basic configuration for logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -28,27 +30,34 @@ def preprocess_text(text):
     lines = text.split('\n')
     return "\n".join(lines)
 
-def process_data_with_ollama(text):
-    """Process data with Ollama AI to extract transactions."""
+MODEL = 'llama3'
+PROMPT = (
+    "Please note: I don't want code! \n Take the data given below and give me a json which has Date, Amount(only keep integers in the amount), Description, Source (Upwork, Employer, Bank, Food, Housing, Utilities, Food, Supplies, Travel, Business Expense) and category (give the category from these 6 'Income, Expenses, Business Expenses, Uncertain Expenses, Tax Deductible Expenses, Subscriptions') analyze the data and description to give me a source of the transactions and category don't provide null, and always return json for the whole data don't skip anything. And even if all the transactions are expenses keep categorizing them."
+    "{\n"
+    '    "Date": "MM-dd-yyyy",\n'
+    '    "Description": "Product or service bought, fetch the description of it",\n'
+    '    "Amount": "Amount took to buy that resource.",\n'
+    '    "Category": "Categorize the payments according to the description"\n'
+    "}\n"
+)
+
+def process_data_with_ollama(text, cache=None):
+    """Process data with Ollama AI to extract transactions, reusing cached answers for unchanged text."""
     data = []
     try:
-        prompt = (
-            "Please note: I don't want code! \n Take the data given below and give me a json which has Date, Amount(only keep integers in the amount), Description, Source (Upwork, Employer, Bank, Food, Housing, Utilities, Food, Supplies, Travel, Business Expense) and category (give the category from these 6 'Income, Expenses, Business Expenses, Uncertain Expenses, Tax Deductible Expenses, Subscriptions') analyze the data and description to give me a source of the transactions and category don't provide null, and always return json for the whole data don't skip anything. And even if all the transactions are expenses keep categorizing them."
-            "{\n"
-            '    "Date": "MM-dd-yyyy",\n'
-            '    "Description": "Product or service bought, fetch the description of it",\n'
-            '    "Amount": "Amount took to buy that resource.",\n'
-            '    "Category": "Categorize the payments according to the description"\n'
-            "}\n"
-            f"data: {text}"
-        )
-        print("Loading...")
-        response = ollama.generate(
-            model='llama3',
-            prompt=prompt
-        )
-        print("Loading complete.")
-        logging.info("API Response: %s", response)
+        prompt = PROMPT + f"data: {text}"
+        cached_response = cache.get_response(text) if cache else None
+        if cached_response is not None:
+            logging.info("Using cached Ollama response")
+            response = {'response': cached_response}
+        else:
+            print("Loading...")
+            response = ollama.generate(
+                model=MODEL,
+                prompt=prompt
+            )
+            print("Loading complete.")
+            logging.info("API Response: %s", response)
 
         # Check if response contains 'response' key and is not empty
         if 'response' not in response or not response['response']:
@@ -64,6 +73,8 @@ def process_data_with_ollama(text):
         transactions = json.loads(parsed_data)
         for transaction in transactions:
             data.append((transaction['Date'], transaction['Description'], transaction['Amount'], transaction['Category']))
+        if cache and cached_response is None:
+            cache.put_response(text, parsed_data)
     except json.JSONDecodeError as e:
         logging.error("JSON decoding failed: %s", str(e))
         # logging.error("Response content: %s", response)
@@ -72,45 +83,21 @@ def process_data_with_ollama(text):
         # logging.error("Response content: %s", response)
     return data
 
-def save_to_excel(data, file_name, sheet_name):
-    """Save extracted data to an Excel file."""
-    try:
-        if os.path.exists(file_name):
-            wb = openpyxl.load_workbook(file_name)
-        else:
-            wb = openpyxl.Workbook()
-            wb.remove(wb.active)  # Remove the default sheet
-
-        if sheet_name not in wb.sheetnames:
-            ws = wb.create_sheet(title=sheet_name)
-            ws.append(("Date", "Description", "Amount", "Category"))  # Only add headers if sheet is newly created
-        else:
-            ws = wb[sheet_name]
-
-        for row in data:
-            ws.append(row)
-
-        # Remove duplicate rows
-        remove_duplicate_rows(ws)
-
-        wb.save(file_name)
-        logging.info("Data written to %s in %s", sheet_name, file_name)
-    except Exception as e:
-        logging.error("Failed to save data to Excel %s: %s", file_name, str(e))
-
-def remove_duplicate_rows(sheet):
-    """Remove duplicate rows from an Excel sheet."""
-    rows = [tuple(cell.value for cell in row) for row in sheet.iter_rows(min_row=2, max_row=sheet.max_row, max_col=sheet.max_column)]
-    unique_rows = set(rows)
-    sheet.delete_rows(2, sheet.max_row)
-    for row in unique_rows:
-        sheet.append(row)
-
-def identify_and_process_pdfs(directory, output_excel):
+def identify_and_process_pdfs(directory, store=None):
     """Identify PDF files in a directory and process them to extract transaction data."""
-    pdf_files = [f for f in os.listdir(directory) if f.endswith('.pdf')]
-    logging.info("Found %d PDF files in the directory.", len(pdf_files))
+    store = store or TransactionStore()
+    manifest = IngestManifest("ai_pdf_extractor", default_manifest_path("ai_pdf_extractor", os.path.dirname(store.root)))
+    if not store.exists(RAW):
+        manifest.forget()
+
+    # Statements already ingested and unchanged since are skipped without opening them
+    pdf_files = [f for f in os.listdir(directory) if f.endswith('.pdf') and not manifest.is_current(os.path.join(directory, f))]
+    logging.info("Found %d new or changed PDF files in the directory.", len(pdf_files))
     
+    # One sink for the whole run: the partition is read once and written once at the end
+    sink = StoreSink(store, RAW)
+    cache = CategorizationCache("ollama", MODEL, PROMPT)
+    processed = {}
     for filename in pdf_files:
         pdf_path = os.path.join(directory, filename)
         logging.info("Processing PDF: %s", pdf_path)
@@ -118,19 +105,36 @@ def identify_and_process_pdfs(directory, output_excel):
         text = extract_text_from_pdf(pdf_path)
         preprocessed_text = preprocess_text(text)
         
-        data = process_data_with_ollama(preprocessed_text)
+        data = process_data_with_ollama(preprocessed_text, cache)
         if not data:
+            # Left out of the manifest so the next run tries it again
             logging.warning("No data extracted from PDF: %s", filename)
-        else:
-            save_to_excel(data, output_excel, "Transactions")
+            continue
+
+        # A changed statement first takes back the rows its previous version produced
+        for sheet_name, previous_rows in (manifest.outputs(pdf_path) or {}).items():
+            sink.remove(sheet_name, previous_rows)
+        sink.add("Transactions", data)
+        processed[pdf_path] = {"Transactions": data}
+
+    try:
+        sink.close()
+        for pdf_path, outputs in processed.items():
+            manifest.record(pdf_path, outputs)
+        manifest.save()
+    except Exception as e:
+        logging.error("Failed to save data to %s: %s", store.root, str(e))
+
+    stats = cache.stats()
+    logging.info("Categorization cache: %d hits, %d misses", stats["hits"], stats["misses"])
+    cache.close()
 
 def main():
     directory_path = "client_docs"
-    output_excel = "processed_files/AI_pdf_output_data.xlsx"
     if not os.path.exists(directory_path):
         logging.warning("Directory %s does not exist. Please check the path.", directory_path)
         return
-    identify_and_process_pdfs(directory_path, output_excel)
+    identify_and_process_pdfs(directory_path, TransactionStore())
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,39 @@
+import json
+from llm_scheduler import estimate_tokens
+
+# Tokens the model needs to echo one row back as Date/Amount/Description/Source/Category JSON,
+# on top of the row's own content
+OUTPUT_TOKENS_PER_ROW = 24
+
+def row_tokens(row):
+    return estimate_tokens(json.dumps(row))
+
+def row_cost(row):
+    # A row is paid for twice (once in the prompt, once echoed back in the JSON answer)
+    return 2 * row_tokens(row) + OUTPUT_TOKENS_PER_ROW
+
+def pack_batches(rows, prompt_tokens, context_window, reserved_output_tokens, cost=row_cost):
+    """Greedily pack rows into batches that fit the model's context window.
+
+    Every batch pays `prompt_tokens` for the instructions and `reserved_output_tokens`
+    of headroom for the reply, and each row adds cost(row) tokens.
+    A row too large to share a batch is sent on its own rather than dropped.
+    """
+    budget = context_window - prompt_tokens - reserved_output_tokens
+    batch = []
+    used = 0
+    for row in rows:
+        cost_of_row = cost(row)
+        if batch and used + cost_of_row > budget:
+            yield batch
+            batch = []
+            used = 0
+        batch.append(row)
+        used += cost_of_row
+    if batch:
+        yield batch
+
+def split_batch(batch):
+    """Split an incompletely answered batch into two halves for a retry."""
+    half = len(batch) // 2
+    return batch[:half], batch[half:]
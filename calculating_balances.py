@@ -1,102 +1,42 @@
+import argparse
+import json
+import os
+import sys
 import openpyxl
-from datetime import datetime, timedelta
-import re
-
-def read_excel_file(file_path, sheets_to_read):
-    try:
-        wb = openpyxl.load_workbook(file_path)
-    except FileNotFoundError:
-        print(f"Error: The file {file_path} was not found.")
-        return None
-    except Exception as e:
-        print(f"An error occurred: {e}")
-        return None
-
-    data = {sheet: [] for sheet in sheets_to_read}
-
-    for sheet_name in sheets_to_read:
-        if sheet_name in wb.sheetnames:
-            sheet = wb[sheet_name]
-            for row in sheet.iter_rows(min_row=2, values_only=True):
-                if row[0] is None or row[1] is None:
-                    continue  # Skip rows with missing essential data
-                entry = {
-                    "date": row[0],
-                    "amount": row[1],
-                    "description": row[2] if row[2] else "",
-                    "source": row[3] if row[3] else ""
-                }
-                data[sheet_name].append(entry)
-        else:
-            print(f"Sheet {sheet_name} not found in the file.")
-
-    return data
-
-def parse_date(date_str):
-    for fmt in ('%m/%d/%y', '%Y-%m-%d', '%d/%m/%Y', '%m/%d/%Y', '%b %d, %Y'):
-        try:
-            return datetime.strptime(date_str, fmt)
-        except ValueError:
-            continue
-    raise ValueError(f"Date format for {date_str} is not recognized.")
-
-def preprocess_amount(amount_str):
-    try:
-        # Convert to string if amount_str is not already a string
-        if not isinstance(amount_str, str):
-            amount_str = str(amount_str)
-        
-        # Remove any non-numeric characters using regex
-        cleaned_amount = re.sub(r'[^0-9.-]', '', amount_str)
-        # If there is a '-' at the end, treat it as a negative sign
-        cleaned_amount = cleaned_amount.lstrip('-')
-        # Convert the cleaned amount to a float
-        float_amount = float(cleaned_amount)
-        return float_amount
-    except ValueError:
-        print(f"Error converting amount: {amount_str} is not a valid number.")
-        return 0
-
-def calculate_weekly_balances(data):
-    if "Income" not in data or "Expenses" not in data:
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from ledger import build_ledger, read_ledger, read_ledger_store, sheet_totals, period_balances
+from transaction_store import CATEGORIZED, TransactionStore
+
+def _as_ledger(data):
+    # Accept either the columnar ledger or the {sheet: [entries]} mapping
+    if isinstance(data, pd.DataFrame):
+        return data
+    return build_ledger(data)
+
+def calculate_weekly_balances(data, period="week"):
+    ledger = _as_ledger(data)
+    if "Income" not in ledger["sheet"].cat.categories or "Expenses" not in ledger["sheet"].cat.categories:
         print("Required data for calculating weekly balances is missing.")
         return []
 
-    combined_data = data["Income"] + data["Expenses"]
-    if not combined_data:
-        return []
-
-    combined_data.sort(key=lambda x: parse_date(x["date"]))
-
-    start_date = parse_date(combined_data[0]["date"])
-    end_date = parse_date(combined_data[-1]["date"])
-
+    balances = period_balances(ledger, period)
     weekly_data = []
-    current_date = start_date
-    while current_date <= end_date:
-        week_start = current_date
-        week_end = current_date + timedelta(days=6)
-        weekly_income = sum(preprocess_amount(entry["amount"]) for entry in data["Income"] if week_start <= parse_date(entry["date"]) <= week_end)
-        weekly_expenses = sum(preprocess_amount(entry["amount"]) for entry in combined_data if week_start <= parse_date(entry["date"]) <= week_end and entry in data["Expenses"])
-
-        weekly_balance = weekly_income - weekly_expenses
+    for week_start, income, expenses, balance in balances.itertuples(index=False):
         weekly_data.append({
             "week_start": week_start.strftime('%m/%d/%y'),
-            "income": weekly_income,
-            "expenses": weekly_expenses,
-            "balance": weekly_balance
+            "income": float(income) / 100,
+            "expenses": float(expenses) / 100,
+            "balance": float(balance) / 100
         })
 
-        current_date += timedelta(days=7)
-
     return weekly_data
 
 def calculate_balance_summary(data, account_balances):
-    total_income = sum(preprocess_amount(entry["amount"]) for entry in data.get("Income", []))
+    totals = sheet_totals(_as_ledger(data))
+    total_income = float(totals.get("Income", 0)) / 100
 
-    total_expenses = sum(
-        preprocess_amount(entry["amount"]) for sheet in data.keys() if sheet != "Income" for entry in data[sheet]
-    )
+    total_expenses = float(totals.drop("Income", errors="ignore").sum()) / 100
 
     net_income = total_income - total_expenses
 
@@ -125,13 +65,10 @@ def write_to_excel(file_path, weekly_balances, balance_summary, account_balances
     except FileNotFoundError:
         wb = openpyxl.Workbook()
         wb.remove(wb.active)
-    except Exception as e:
-        print(f"Error loading workbook: {e}")
-        return
 
     # Handle Weekly Budget sheet
     weekly_budget_sheet = wb.create_sheet(title="Weekly Budget") if "Weekly Budget" not in wb.sheetnames else wb["Weekly Budget"]
-    weekly_budget_sheet.delete_rows(2, weekly_budget_sheet.max_row + 1)
+    weekly_budget_sheet.delete_rows(1, weekly_budget_sheet.max_row)
     weekly_budget_sheet.append(["Week Start", "Income", "Expenses", "Balance"])
     for weekly_balance in weekly_balances:
         weekly_budget_sheet.append([
@@ -143,43 +80,56 @@ def write_to_excel(file_path, weekly_balances, balance_summary, account_balances
 
     # Handle Balance Summary sheet
     balance_summary_sheet = wb.create_sheet(title="Balance Summary") if "Balance Summary" not in wb.sheetnames else wb["Balance Summary"]
-    balance_summary_sheet.delete_rows(2, balance_summary_sheet.max_row + 1)
+    balance_summary_sheet.delete_rows(1, balance_summary_sheet.max_row)
     for description, amount in balance_summary.items():
         balance_summary_sheet.append([description, amount])
 
     # Handle Balances sheet
     balances_sheet = wb.create_sheet(title="Balances") if "Balances" not in wb.sheetnames else wb["Balances"]
-    balances_sheet.delete_rows(2, balances_sheet.max_row + 1)
+    balances_sheet.delete_rows(1, balances_sheet.max_row)
     balances_sheet.append(["Account Type", "Amount"])
     for account_type, balance in account_balances.items():
         balances_sheet.append([account_type, balance])
 
-    try:
-        wb.save(file_path)
-    except Exception as e:
-        print(f"Error saving workbook: {e}")
-
-def main():
-    file_path = "ollamaa/categorized_data.xlsx"
-    sheets_to_read = ["Income", "Expenses", "Business Expenses", "Tax Deductible Expenses", "Subscriptions", "Uncertain Expenses"]
-    
-    data = read_excel_file(file_path, sheets_to_read)
-    if data is None:
-        return
+    wb.save(file_path)
 
-    if not data["Income"] or not any(data[sheet] for sheet in sheets_to_read if sheet != "Income"):
-        print("No data found in Income or Expense sheets.")
-        return
+SHEETS_TO_READ = ["Income", "Expenses", "Business Expenses", "Tax Deductible Expenses", "Subscriptions", "Uncertain Expenses"]
+DEFAULT_WORKBOOK_PATH = "ollamaa/categorized_data.xlsx"
+DEFAULT_BALANCES_PATH = "account_balances.json"
 
-    weekly_balances = calculate_weekly_balances(data)
+def load_account_balances(path):
+    """Read {"Account Type": balance} from a JSON file, raising ValueError for non-numeric balances."""
+    with open(path) as balances_file:
+        raw_balances = json.load(balances_file)
+    account_balances = {}
+    for account_type, balance in raw_balances.items():
+        try:
+            account_balances[str(account_type).strip()] = float(balance)
+        except (TypeError, ValueError):
+            raise ValueError(f"Balance for {account_type} in {path} is not a valid number: {balance!r}")
+    return account_balances
 
+def parse_balance_arguments(values):
+    """Turn ["Checking=1200.50", ...] from the command line into {"Checking": 1200.5}."""
+    account_balances = {}
+    for value in values:
+        account_type, separator, balance = value.rpartition("=")
+        if not separator or not account_type.strip():
+            raise ValueError(f"Expected ACCOUNT=BALANCE, got {value!r}")
+        try:
+            account_balances[account_type.strip()] = float(balance)
+        except ValueError:
+            raise ValueError(f"Balance for {account_type.strip()} is not a valid number: {balance!r}")
+    return account_balances
+
+def prompt_account_balances():
     # Get account balances from the user
     account_balances = {}
     try:
         num_accounts = int(input("Enter the number of accounts: "))
     except ValueError:
         print("Invalid number entered. Please enter a valid integer for the number of accounts.")
-        return
+        return None
 
     for _ in range(num_accounts):
         account_type = input("Enter Account Type: ").strip()
@@ -192,10 +142,115 @@ def main():
                 print(f"Error: '{balance_input}' is not a valid float. Please enter a numeric balance.")
 
         account_balances[account_type] = balance
+    return account_balances
+
+def load_client_ledger(file_path, store=None, sheets_to_read=SHEETS_TO_READ):
+    # groqparser keeps the categorized rows in the store; without one the client's own workbook is read,
+    # never the shared default store, which may hold another client's ledger
+    if store is not None and store.exists(CATEGORIZED):
+        return read_ledger_store(store, sheets_to_read, CATEGORIZED)
+    return read_ledger(file_path, sheets_to_read)
+
+def process_client(file_path, account_balances, store=None):
+    """Compute one client's weekly balances and summary and write them to its workbook.
 
+    Returns the balance summary, or None when the client has no income or expense data.
+    """
+    data = load_client_ledger(file_path, store)
+    if data is None:
+        return None
+
+    if not (data["sheet"] == "Income").any() or not (data["sheet"] != "Income").any():
+        print("No data found in Income or Expense sheets.")
+        return None
+
+    weekly_balances = calculate_weekly_balances(data)
     balance_summary = calculate_balance_summary(data, account_balances)
     write_to_excel(file_path, weekly_balances, balance_summary, account_balances)
+    return balance_summary
+
+def run_client(client):
+    """Process one entry of a batch file; runs in a worker process when the batch is parallel."""
+    if "balances" in client:
+        account_balances = {account_type: float(balance) for account_type, balance in client["balances"].items()}
+    elif "balances_file" in client:
+        account_balances = load_account_balances(client["balances_file"])
+    else:
+        account_balances = {}
+    store = TransactionStore(client["store"]) if client.get("store") else None
+    return process_client(client.get("workbook", DEFAULT_WORKBOOK_PATH), account_balances, store)
+
+def run_batch(clients, workers=1):
+    """Compute summaries for many clients in one process or across a process pool.
+
+    Each client is a dict with a "name", its "workbook", optionally its "store"
+    root, and either inline "balances" or a "balances_file". A client without
+    a "store" is read from its workbook. Returns
+    {name: summary}; a client that fails or has no data maps to None.
+    """
+    names = [client.get("name", client.get("workbook", DEFAULT_WORKBOOK_PATH)) for client in clients]
+    summaries = {}
+    if workers > 1 and len(clients) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(run_client, client) for client in clients]
+            for name, future in zip(names, futures):
+                try:
+                    summaries[name] = future.result()
+                except Exception as e:
+                    print(f"Error processing client {name}: {e}")
+                    summaries[name] = None
+    else:
+        for name, client in zip(names, clients):
+            try:
+                summaries[name] = run_client(client)
+            except Exception as e:
+                print(f"Error processing client {name}: {e}")
+                summaries[name] = None
+
+    done = sum(summary is not None for summary in summaries.values())
+    print(f"Balance summaries written for {done} of {len(clients)} clients.")
+    return summaries
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Weekly balances and budget summary from the categorized transactions.")
+    parser.add_argument("--workbook", default=DEFAULT_WORKBOOK_PATH, help="workbook the report sheets are written to")
+    parser.add_argument("--store", help="transaction store root to read the categorized rows from")
+    parser.add_argument("--balances-file", help=f"JSON file of {{account type: balance}} (default: {DEFAULT_BALANCES_PATH} if it exists)")
+    parser.add_argument("--balance", action="append", default=[], metavar="ACCOUNT=BALANCE", help="account balance; repeat for several accounts")
+    parser.add_argument("--batch", help="JSON file listing many clients to process in one run")
+    parser.add_argument("--workers", type=int, default=1, help="processes used for --batch")
+    return parser.parse_args(argv)
+
+def main(argv=()):
+    args = parse_args(argv)
+
+    if args.batch:
+        with open(args.batch) as batch_file:
+            run_batch(json.load(batch_file), args.workers)
+        return
+
+    # Balances come from the command line, then a balances file, and only then from the terminal
+    try:
+        if args.balance:
+            account_balances = parse_balance_arguments(args.balance)
+        elif args.balances_file or os.path.exists(DEFAULT_BALANCES_PATH):
+            account_balances = load_account_balances(args.balances_file or DEFAULT_BALANCES_PATH)
+        elif sys.stdin.isatty():
+            account_balances = prompt_account_balances()
+            if account_balances is None:
+                raise ValueError("No account balances entered.")
+        else:
+            raise ValueError(f"No account balances given and no terminal to ask; pass --balance, --balances-file or create {DEFAULT_BALANCES_PATH}.")
+    except (OSError, ValueError) as e:
+        # Raised, as every failure below is, so run_all does not count the stage as done
+        print(f"Error reading account balances: {e}")
+        raise
+
+    # A single run reads the pipeline's store unless told otherwise; --batch clients name their own
+    store = TransactionStore(args.store) if args.store else TransactionStore()
+    if process_client(args.workbook, account_balances, store) is None:
+        raise RuntimeError(f"No income and expense data for {args.workbook}; the report sheets were not written.")
     print("Weekly Budget, Balance Summary, and Account Balances have been successfully written to the file.")
 
 if __name__ == "__main__":
-    main()
+    main(sys.argv[1:])
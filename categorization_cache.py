@@ -0,0 +1,142 @@
+import hashlib
+import os
+import re
+import sqlite3
+import time
+
+DEFAULT_CACHE_PATH = "processed_files/categorization_cache.sqlite"
+DEFAULT_MAX_ENTRIES = 50000
+
+# Parts of a description that change between otherwise identical transactions
+_DATE_PATTERN = re.compile(r'\b\d{1,4}[/-]\d{1,2}[/-]\d{1,4}\b|\b(?:jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]* \d{1,2},? \d{4}\b')
+_AMOUNT_PATTERN = re.compile(r'[-+(]?\$?\d[\d,]*\.\d+\)?%?')
+_TOKEN_WITH_DIGITS_PATTERN = re.compile(r'\S*\d\S*')  # IDs, references, emails, trace numbers
+_NON_WORD_PATTERN = re.compile(r'[^a-z&]+')
+
+def fingerprint(description):
+    """Normalize a description so recurring transactions share one cache key."""
+    text = str(description or "").lower()
+    text = _DATE_PATTERN.sub(" ", text)
+    text = _AMOUNT_PATTERN.sub(" ", text)
+    text = _TOKEN_WITH_DIGITS_PATTERN.sub(" ", text)
+    return _NON_WORD_PATTERN.sub(" ", text).strip()
+
+def _digest(*parts):
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+class CategorizationCache:
+    """On-disk map from description fingerprint to (category, source), backed by SQLite.
+
+    Entries live under a namespace (one per pipeline) and a version derived from the
+    model name and prompt; opening the cache drops the namespace's entries from any
+    other version, so changing either one starts from a clean slate. The least
+    recently used entries beyond max_entries are evicted on close().
+    """
+
+    def __init__(self, namespace, model, prompt, path=DEFAULT_CACHE_PATH, max_entries=DEFAULT_MAX_ENTRIES):
+        self.namespace = namespace
+        self.version = _digest(model, prompt)[:16]
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS categories (
+                namespace TEXT, version TEXT, fingerprint TEXT,
+                category TEXT, source TEXT, hits INTEGER DEFAULT 0, last_used REAL,
+                PRIMARY KEY (namespace, version, fingerprint)
+            );
+            CREATE TABLE IF NOT EXISTS responses (
+                namespace TEXT, version TEXT, digest TEXT,
+                response TEXT, last_used REAL,
+                PRIMARY KEY (namespace, version, digest)
+            );
+        """)
+        for table in ("categories", "responses"):
+            self.connection.execute(f"DELETE FROM {table} WHERE namespace = ? AND version != ?", (self.namespace, self.version))
+        self.connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def get(self, description):
+        key = fingerprint(description)
+        row = None
+        if key:
+            row = self.connection.execute(
+                "SELECT category, source FROM categories WHERE namespace = ? AND version = ? AND fingerprint = ?",
+                (self.namespace, self.version, key),
+            ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.connection.execute(
+            "UPDATE categories SET hits = hits + 1, last_used = ? WHERE namespace = ? AND version = ? AND fingerprint = ?",
+            (time.time(), self.namespace, self.version, key),
+        )
+        return row
+
+    def put(self, description, category, source):
+        key = fingerprint(description)
+        if not key or not category:
+            return
+        self.connection.execute(
+            "INSERT OR REPLACE INTO categories (namespace, version, fingerprint, category, source, hits, last_used) VALUES (?, ?, ?, ?, ?, 0, ?)",
+            (self.namespace, self.version, key, category, source or "", time.time()),
+        )
+
+    def get_response(self, text):
+        """Return the cached model response for a whole document, if any."""
+        digest = _digest(text)
+        row = self.connection.execute(
+            "SELECT response FROM responses WHERE namespace = ? AND version = ? AND digest = ?",
+            (self.namespace, self.version, digest),
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.connection.execute(
+            "UPDATE responses SET last_used = ? WHERE namespace = ? AND version = ? AND digest = ?",
+            (time.time(), self.namespace, self.version, digest),
+        )
+        return row[0]
+
+    def put_response(self, text, response):
+        self.connection.execute(
+            "INSERT OR REPLACE INTO responses (namespace, version, digest, response, last_used) VALUES (?, ?, ?, ?, ?)",
+            (self.namespace, self.version, _digest(text), response, time.time()),
+        )
+
+    def evict(self):
+        for table in ("categories", "responses"):
+            self.connection.execute(
+                f"""DELETE FROM {table} WHERE rowid IN (
+                    SELECT rowid FROM {table} WHERE namespace = ?
+                    ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                )""",
+                (self.namespace, self.max_entries),
+            )
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        entries = self.connection.execute(
+            "SELECT COUNT(*) FROM categories WHERE namespace = ?", (self.namespace,)
+        ).fetchone()[0]
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+        }
+
+    def close(self):
+        self.evict()
+        self.connection.commit()
+        self.connection.close()
@@ -0,0 +1,88 @@
+from datetime import datetime
+from functools import lru_cache
+
+# Known date shapes, tried in order. The first five are the formats calculating_balances has
+# always accepted; the rest cover the Venmo "Datetime" column and long month names.
+# Statements are US-style and dates are written back as MM/DD/YYYY, so an ambiguous
+# value such as 03/05/2024 is read month-first everywhere; day-first is only a fallback.
+DATE_FORMATS = (
+    '%m/%d/%y',
+    '%Y-%m-%d',
+    '%m/%d/%Y',
+    '%d/%m/%Y',
+    '%b %d, %Y',  # Upwork, eBay: "Dec 30, 2023"
+    '%Y-%m-%dT%H:%M:%S',  # Venmo: "2023-02-02T03:55:46"
+    '%Y-%m-%d %H:%M:%S',
+    '%B %d, %Y',
+)
+
+# Columns are sniffed in the same order as single cells, but ColumnDateParser and
+# ledger.parse_dates then lock the format of the column's first value. A value the
+# locked format also matches reads that way, so in a column starting 25/12/2023 a
+# later 03/04/2023 is 3 April, where parse_date alone reads it as March 4.
+COLUMN_FORMATS = DATE_FORMATS
+
+OUTPUT_FORMAT = '%m/%d/%Y'
+
+@lru_cache(maxsize=65536)
+def _strptime(date_str, fmt):
+    try:
+        return datetime.strptime(date_str, fmt)
+    except ValueError:
+        return None
+
+@lru_cache(maxsize=65536)
+def _parse_date_string(date_str, formats=DATE_FORMATS):
+    """Return (datetime, format) for the first of formats matching date_str, or (None, None)."""
+    for fmt in formats:
+        parsed = _strptime(date_str, fmt)
+        if parsed is not None:
+            return parsed, fmt
+    return None, None
+
+def sniff_format(date_str, formats=COLUMN_FORMATS):
+    """Return the first of formats that parses date_str, or None."""
+    return _parse_date_string(str(date_str).strip(), formats)[1]
+
+def parse_date(value):
+    """Parse a date cell into a datetime, raising ValueError if no known format matches."""
+    if isinstance(value, datetime):
+        return value
+    parsed, _ = _parse_date_string(str(value).strip())
+    if parsed is None:
+        raise ValueError(f"Date format for {value} is not recognized.")
+    return parsed
+
+class ColumnDateParser:
+    """Parse the dates of one column, locking the first format that succeeds.
+
+    Statement columns use a single format throughout, so after the first hit every
+    value is tried against that format only; the full list is consulted on a miss.
+    """
+
+    def __init__(self):
+        self.format = None
+
+    def parse(self, value):
+        if isinstance(value, datetime):
+            return value
+        date_str = str(value).strip()
+        if self.format is not None:
+            parsed = _strptime(date_str, self.format)
+            if parsed is not None:
+                return parsed
+        parsed, fmt = _parse_date_string(date_str, COLUMN_FORMATS)
+        if parsed is None:
+            raise ValueError(f"Date format for {value} is not recognized.")
+        if self.format is None:
+            self.format = fmt
+        return parsed
+
+    def normalize(self, value, output_format=OUTPUT_FORMAT):
+        """Reformat a date cell as output_format, leaving unrecognized values untouched."""
+        if value is None or value == "":
+            return value
+        try:
+            return self.parse(value).strftime(output_format)
+        except ValueError:
+            return value
@@ -0,0 +1,23 @@
+import openpyxl
+
+def iter_sheet_rows(file_path):
+    """Yield (sheet_name, header, rows) for every sheet of a workbook.
+
+    The workbook is opened read-only and rows are streamed as value tuples, so
+    memory stays flat no matter how large the file is. `header` is the first
+    row (or an empty tuple for an empty sheet) and `rows` lazily yields the
+    rest; consume it before moving on to the next sheet.
+    """
+    wb = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        for sheet in wb.worksheets:
+            rows = sheet.iter_rows(values_only=True)
+            header = next(rows, ())
+            yield sheet.title, header, rows
+    finally:
+        wb.close()
+
+def iter_records(rows, columns):
+    """Map streamed row tuples to dicts using a {key: column index} mapping."""
+    for row in rows:
+        yield {key: row[index] if index is not None and index < len(row) else None for key, index in columns.items()}
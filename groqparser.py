@@ -1,13 +1,31 @@
-import openpyxl
+import asyncio
 import json
 import os
-import time
+import re
 from dotenv import load_dotenv
-from groq import Groq
+from groq import AsyncGroq
+from date_parser import ColumnDateParser
+from excel_reader import iter_records
+from llm_scheduler import RateLimiter, call_with_retry, estimate_tokens, iter_ordered
+from batch_packer import pack_batches, row_cost, split_batch
+from categorization_cache import DEFAULT_CACHE_PATH, CategorizationCache, fingerprint
+from rule_classifier import RuleClassifier
+from transaction_store import CATEGORIZED, RAW, StoreSink, TransactionStore
 
 # Load environment variables
 load_dotenv()
 api_key = os.getenv("GROQ_API_KEY")
+model = "llama3-70b-8192"
+context_window = 8192
+reserved_output_tokens = 512  # Headroom for any text the model wraps around the JSON
+
+# Scheduling limits for the Groq API. The client also honours GROQ_BASE_URL,
+# which lets the scheduler run against a local fake completion server.
+concurrency = int(os.getenv("GROQ_CONCURRENCY", "4"))
+requests_per_minute = int(os.getenv("GROQ_REQUESTS_PER_MINUTE", "30"))
+tokens_per_minute = int(os.getenv("GROQ_TOKENS_PER_MINUTE", "6000"))
+
+CATEGORIZED_HEADER = ("Date", "Amount", "Description", "Source")
 
 # Categories
 categories = [
@@ -19,114 +37,72 @@ categories = [
     "Uncertain Expenses",
 ]
 
-def read_excel_file(file_path):
-    try:
-        wb = openpyxl.load_workbook(file_path)
-        sheets_data = {}
-
-        for sheet in wb.worksheets:
-            max_row = sheet.max_row
-            max_column = sheet.max_column
-
-            date_column = None
-            description_column = None
-            amount_column = None
-
-            for col_idx in range(1, max_column + 1):
-                cell_value = sheet.cell(row=1, column=col_idx).value
-                if cell_value:
-                    cell_value_lower = cell_value.lower()
-                    if any(keyword in cell_value_lower for keyword in ["date", "total"]):
-                        date_column = col_idx
-                    elif "description" in cell_value_lower:
-                        description_column = col_idx
-                    elif "amount" in cell_value_lower:
-                        amount_column = col_idx
-
-            # Skip the sheet if all required columns are not found
-            if date_column is None or description_column is None or amount_column is None:
-                print(f"Skipping sheet {sheet.title}: required columns not found.")
-                continue
-
-            # Extract data from the identified columns
-            data = []
-            for row_idx in range(2, max_row + 1):
-                entry = {
-                    "date": sheet.cell(row=row_idx, column=date_column).value,
-                    "description": sheet.cell(row=row_idx, column=description_column).value,
-                    "amount": sheet.cell(row=row_idx, column=amount_column).value
-                }
-                data.append(entry)
-
-            sheets_data[sheet.title] = data
-
-        return sheets_data
-    except Exception as e:
-        print(f"An error occurred while reading the Excel file: {e}")
-        return None
-
-def create_excel_file(response_data, categories, file_name):
-    try:
-        wb = openpyxl.load_workbook(file_name)
-    except FileNotFoundError:
-        wb = openpyxl.Workbook()
-        wb.remove(wb.active)
-
-    sheets = {}
-    for category in categories:
-        if category in wb.sheetnames:
-            sheets[category] = wb[category]
-        else:
-            sheets[category] = wb.create_sheet(title=category)
-            sheets[category].append(["Date", "Amount", "Description", "Source"])
-
+def find_columns(header):
+    # Sheets written by newparser and pdfextractor use exactly these headers
+    names = [str(cell_value).strip().lower() if cell_value else "" for cell_value in header]
+    columns = [names.index(name) if name in names else None for name in ("date", "description", "amount")]
+
+    # Other sheets: the first header containing each keyword wins
+    for position, keyword in enumerate(("date", "description", "amount")):
+        if columns[position] is None:
+            columns[position] = next((col_idx for col_idx, name in enumerate(names) if keyword in name), None)
+
+    date_column, description_column, amount_column = columns
+    return date_column, description_column, amount_column
+
+# Stream (partition, records) pairs from the raw transaction store, loading only the three columns used.
+# A partition that cannot be read raises: CATEGORIZED is rebuilt from every partition, so skipping one would drop its rows.
+def read_store(store):
+    for partition in store.partitions(RAW):
+        header = store.columns(RAW, partition)
+        date_column, description_column, amount_column = find_columns(header)
+        if date_column is None or description_column is None or amount_column is None:
+            print(f"Skipping partition {partition}: required columns not found.")
+            continue
+
+        names = [header[date_column], header[description_column], header[amount_column]]
+        frame = store.read_partition(RAW, partition, columns=names)
+        frame = frame.astype(object).where(frame.notna(), None)
+        date_parser = ColumnDateParser()
+        records = iter_records(frame.itertuples(index=False, name=None), {"date": 0, "description": 1, "amount": 2})
+        yield partition, (dict(entry, date=date_parser.normalize(entry["date"])) for entry in records)
+
+def store_categorized(response_data, categories, sink):
+    # Buffer each transaction in its category's partition; every category gets a partition, as it got a sheet.
+    # The sink writes each partition once, when it is closed.
+    rows = {category: [] for category in categories}
     for entry in response_data:
         # Normalize keys to lowercase
         normalized_entry = {k.lower(): v for k, v in entry.items()}
         category = normalized_entry.get("category")
-        if category in sheets:
-            sheets[category].append([normalized_entry.get("date"), normalized_entry.get("amount"), normalized_entry.get("description"), normalized_entry.get("source")])
-
-    try:
-        wb.save(file_name)
-    except Exception as e:
-        print(f"An error occurred while saving the Excel file: {e}")
-
-def get_groq_response(categorized_data):
-    try:
-        client = Groq(api_key=api_key)
-
-        # Calculate the context length of the messages
-        prompt_message = f"Please note: I don't want code! {json.dumps(categorized_data)} \n Take this data and give me a json which has Date, Amount(only keep integers in the amount), Description, Source (Upwork, Employer, Bank, Food, Housing, Utilities, Food, Supplies, Travel, Business Expense) and category (give the category from these 6 'Income, Expenses, Business Expenses, Uncertain Expenses, Tax Deductible Expenses, Subscriptions') analyze the data and description to give me a source of the transactions and category don't provide null, and always return json for the whole data don't skip anything. And even if all the transactions are expenses keep categorizing them."
-        context_length = len(prompt_message)
-        print(f"Context length: {context_length}")
-
-        # Define a limit for the context length (e.g., 6000 tokens, which is a common limit)
-        context_limit = 6000
-
-        # Truncate the prompt if it exceeds the limit
-        if context_length > context_limit:
-            print(f"Truncating context from {context_length} to {context_limit}")
-            truncated_message = prompt_message[:context_limit]
-        else:
-            truncated_message = prompt_message
-
-        chat_completion = client.chat.completions.create(
-            messages=[
-                {
-                    "role": "user",
-                    "content": truncated_message,
-                }
-            ],
-            model="llama3-70b-8192",
-        )
-
-        response = chat_completion.choices[0].message.content
-        print("Raw response from Groq:", response)
-        return response
-    except Exception as e:
-        print(f"An error occurred while getting Groq response: {e}")
-        return None
+        if category in rows:
+            rows[category].append([normalized_entry.get("date"), normalized_entry.get("amount"), normalized_entry.get("description"), normalized_entry.get("source")])
+    for category, category_rows in rows.items():
+        sink.add(category, category_rows)
+
+def build_prompt(categorized_data):
+    return f"Please note: I don't want code! {json.dumps(categorized_data)} \n Take this data and give me a json which has Date, Amount(only keep integers in the amount), Description, Source (Upwork, Employer, Bank, Food, Housing, Utilities, Food, Supplies, Travel, Business Expense) and category (give the category from these 6 'Income, Expenses, Business Expenses, Uncertain Expenses, Tax Deductible Expenses, Subscriptions') analyze the data and description to give me a source of the transactions and category don't provide null, and always return json for the whole data don't skip anything. And even if all the transactions are expenses keep categorizing them."
+
+async def get_groq_response_async(client, limiter, categorized_data):
+    prompt_message = build_prompt(categorized_data)
+    print(f"Prompt tokens: {estimate_tokens(prompt_message)} for {len(categorized_data)} rows")
+
+    # Reserve the prompt plus roughly the same again for the JSON that comes back
+    await limiter.acquire(estimate_tokens(prompt_message) + estimate_tokens(json.dumps(categorized_data)))
+    chat_completion = await call_with_retry(
+        client.chat.completions.create,
+        messages=[
+            {
+                "role": "user",
+                "content": prompt_message,
+            }
+        ],
+        model=model,
+    )
+
+    response = chat_completion.choices[0].message.content
+    print("Raw response from Groq:", response)
+    return response
 
 def extract_json_from_string(string):
     try:
@@ -155,51 +131,139 @@ def extract_json_from_string(string):
         print(f"An error occurred while extracting JSON from string: {e}")
         return None
 
-def process_sheet(sheet_data, categories, file_name):
-    try:
-        batch_size = 12  # Number of rows to process in each batch
-        for i in range(0, len(sheet_data), batch_size):
-            batch = sheet_data[i:i + batch_size]
-            response = get_groq_response(batch)
-
-            try:
-                json_objects = extract_json_from_string(response)
-                if not json_objects:
-                    raise ValueError("No valid JSON objects found in the response.")
-            except json.JSONDecodeError as e:
-                print(f"Error parsing JSON from response: {e}")
-                continue
-
-            print("Extracted JSON objects:", json_objects)
-            create_excel_file(json_objects, categories, file_name)
-
-            # Add delay between API requests
-            time.sleep(2)
-    except Exception as e:
-        print(f"An error occurred while processing the sheet: {e}")
+def flatten_transactions(json_objects):
+    # Unwrap answers shaped like {"transactions": [...]} into one object per row
+    transactions = []
+    for json_object in json_objects:
+        nested = [value for value in json_object.values() if isinstance(value, list) and value and all(isinstance(item, dict) for item in value)]
+        if nested:
+            for value in nested:
+                transactions.extend(value)
+        else:
+            transactions.append(json_object)
+    return transactions
 
-def main():
+def integer_amount(amount):
+    # Match what the prompt asks the model for: the amount with only its integer part
+    cleaned = re.sub(r'[^0-9.-]', '', str(amount))
     try:
-        directory_path = "processed_files"
-        output_excel = "ollamaa/categorized_data.xlsx"
-
-        if not os.path.exists(directory_path):
-            print(f"Directory {directory_path} does not exist. Please check the path.")
-            return
-
-        # Process all .xlsx files in the directory
-        for file_name in os.listdir(directory_path):
-            if file_name.endswith(".xlsx"):
-                file_path = os.path.join(directory_path, file_name)
-                print(f"Processing file: {file_path}")
-                sheets_data = read_excel_file(file_path)
-                for sheet_name, sheet_data in sheets_data.items():
-                    if sheet_data is None:
-                        continue
-                    print(f"Processing sheet: {sheet_name} in file: {file_name}")
-                    process_sheet(sheet_data, categories, output_excel)
-    except Exception as e:
-        print(f"An error occurred in the main function: {e}")
+        value = int(float(cleaned))
+    except ValueError:
+        return amount
+    return -abs(value) if str(amount).strip().startswith("(") else value
+
+def local_transaction(row, classification):
+    category, source = classification
+    return {
+        "Date": row["date"],
+        "Amount": integer_amount(row["amount"]),
+        "Description": row["description"],
+        "Source": source,
+        "Category": category,
+    }
+
+def classify_locally(rows, cache, classifier):
+    # Pair each row with a transaction from the cache or the keyword rules,
+    # or None when it has to go to the model
+    for row in rows:
+        classification = cache.get(row["description"]) if cache else None
+        if classification is None and classifier:
+            classification = classifier.classify(row["description"])
+        yield row, local_transaction(row, classification) if classification else None
+
+def local_row_cost(item):
+    row, local = item
+    return 0 if local is not None else row_cost(row)
+
+async def categorize_batches(batches, cache=None):
+    # Yield the JSON objects for each batch, in batch order, keeping several requests in flight
+    client = AsyncGroq(api_key=api_key, max_retries=0)  # Retries are handled by call_with_retry
+    limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+
+    async def categorize(batch):
+        try:
+            response = await get_groq_response_async(client, limiter, batch)
+        except Exception as e:
+            print(f"An error occurred while getting Groq response: {e}")
+            return []
+        json_objects = flatten_transactions(extract_json_from_string(response) or [])
+        if len(json_objects) < len(batch) and len(batch) > 1:
+            # The model skipped rows; split the batch and retry each half within this slot
+            print(f"Incomplete response: {len(json_objects)} of {len(batch)} rows; splitting the batch")
+            first_half, second_half = split_batch(batch)
+            return await categorize(first_half) + await categorize(second_half)
+        if not json_objects:
+            print("No valid JSON objects found in the response.")
+            return []
+        print("Extracted JSON objects:", json_objects)
+        return json_objects
+
+    async def categorize_unresolved(items):
+        # Only rows the cache and rules could not classify are sent to the model
+        misses = [row for row, local in items if local is None]
+        answered = await categorize(misses) if misses else []
+        if len(answered) != len(misses):
+            # A failed call or rows the model kept skipping; CATEGORIZED is rebuilt from this run,
+            # so storing the rest would lose these rows for good
+            raise RuntimeError(f"Groq answered {len(answered)} of {len(misses)} rows")
+        # Answers are paired with rows by position, so an answer is only cached when its description
+        # still fingerprints like the row's; a reordered or rewritten answer would cache the wrong category
+        if cache:
+            for row, json_object in zip(misses, answered):
+                normalized_object = {k.lower(): v for k, v in json_object.items()}
+                if fingerprint(normalized_object.get("description")) != fingerprint(row["description"]):
+                    continue
+                cache.put(row["description"], normalized_object.get("category"), normalized_object.get("source"))
+        answers = iter(answered)
+        return [local if local is not None else next(answers) for _, local in items]
+
+    async for json_objects in iter_ordered(batches, categorize_unresolved, concurrency):
+        yield json_objects
+
+async def process_sheet_async(sheet_data, categories, sink, cache=None, classifier=None):
+    # Pack as many unresolved rows per request as the context window allows
+    items = classify_locally(sheet_data, cache, classifier)
+    batches = pack_batches(items, estimate_tokens(build_prompt([])), context_window, reserved_output_tokens, cost=local_row_cost)
+
+    # Results arrive in row order and are buffered in the sink until main() closes it
+    async for json_objects in categorize_batches(batches, cache):
+        store_categorized(json_objects, categories, sink)
+
+def process_sheet(sheet_data, categories, sink, cache=None, classifier=None):
+    asyncio.run(process_sheet_async(sheet_data, categories, sink, cache, classifier))
+
+def main(store=None, output_excel="ollamaa/categorized_data.xlsx", cache_path=DEFAULT_CACHE_PATH):
+    # Returns the number of rows categorized by this run. Errors are raised, not printed, so a run
+    # that could not categorize every row fails and leaves the previous CATEGORIZED in place.
+    store = store or TransactionStore()
+
+    if not store.exists(RAW):
+        print(f"No extracted transactions in {store.root}. Run newparser and pdfextractor first.")
+        return 0
+
+    # Process every raw partition; categorized rows go back into the store. CATEGORIZED is
+    # rebuilt from RAW on every run, so a rerun replaces the previous rows instead of adding
+    # to them; rows categorized before are answered by the cache without calling the model.
+    # Nothing is written until every partition is done.
+    classifier = RuleClassifier()
+    sink = StoreSink(store, CATEGORIZED, header=CATEGORIZED_HEADER, dedupe=False, replace=True)
+    with CategorizationCache("groq", model, build_prompt([]), cache_path) as cache:
+        for partition, sheet_data in read_store(store):
+            print(f"Processing partition: {partition}")
+            process_sheet(sheet_data, categories, sink, cache, classifier)
+        cache_stats = cache.stats()
+        print(f"Categorization cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses ({cache_stats['hit_rate']:.0%} hit rate), {cache_stats['entries']} entries")
+    stats = classifier.stats()
+    print(f"Rule classifier: {stats['matched']} of {stats['total']} cache misses ({stats['short_circuit_rate']:.0%}) classified without the model")
+    # Every row goes through the cache first, so its hits plus misses are all the rows
+    rows = cache_stats['hits'] + cache_stats['misses']
+    local = cache_stats['hits'] + stats['matched']
+    print(f"{local} of {rows} rows ({local / rows if rows else 0:.0%}) categorized without the model")
+
+    # The workbook is only an export for the chatbot and calculating_balances' report sheets
+    sink.close()
+    store.export_excel(CATEGORIZED, output_excel, categories)
+    return sink.added
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,72 @@
+import hashlib
+import json
+import os
+
+def default_manifest_path(parser, output_dir="processed_files"):
+    return os.path.join(output_dir, f"{parser}_manifest.json")
+
+def file_digest(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as source_file:
+        for block in iter(lambda: source_file.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+class IngestManifest:
+    """Record of the source files one parser has ingested and the output it produced from each.
+
+    Files are identified by path and checked by size and mtime first, so an
+    unchanged file is recognised without reading it. When only the mtime moved,
+    the content hash decides. Each parser keeps its own manifest file so parsers
+    running side by side never overwrite each other's entries.
+    """
+
+    def __init__(self, parser, path=None):
+        self.parser = parser
+        self.path = path or default_manifest_path(parser)
+        self.entries = {}
+        if os.path.exists(self.path):
+            with open(self.path) as manifest_file:
+                self.entries = json.load(manifest_file)
+
+    def _key(self, file_path):
+        return os.path.abspath(file_path)
+
+    def is_current(self, file_path):
+        entry = self.entries.get(self._key(file_path))
+        if entry is None:
+            return False
+        stat = os.stat(file_path)
+        if entry["size"] != stat.st_size:
+            return False
+        if entry["mtime"] == stat.st_mtime:
+            return True
+        # Touched but maybe not changed: fall back to the content hash
+        if entry["sha256"] != file_digest(file_path):
+            return False
+        entry["mtime"] = stat.st_mtime
+        return True
+
+    def outputs(self, file_path):
+        """Output recorded for a file by its last ingestion, or None."""
+        entry = self.entries.get(self._key(file_path))
+        return entry["outputs"] if entry else None
+
+    def record(self, file_path, outputs):
+        stat = os.stat(file_path)
+        self.entries[self._key(file_path)] = {
+            "parser": self.parser,
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "sha256": file_digest(file_path),
+            "outputs": outputs,
+        }
+
+    def forget(self):
+        # The output was deleted, so nothing recorded here exists any more
+        self.entries = {}
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "w") as manifest_file:
+            json.dump(self.entries, manifest_file, indent=2, default=str)
@@ -0,0 +1,179 @@
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+from date_parser import COLUMN_FORMATS, sniff_format
+from excel_reader import iter_sheet_rows
+
+# Number of days in each fixed-size period; month and quarter follow the calendar
+PERIOD_DAYS = {"day": 1, "week": 7}
+PERIOD_MONTHS = {"month": 1, "quarter": 3}
+
+LEDGER_COLUMNS = ["date", "cents", "description", "source", "sheet"]
+
+def parse_dates(values):
+    """Parse a column of dates into datetime64, trying one known format at a time on the whole column."""
+    values = pd.Series(values, dtype=object).reset_index(drop=True)
+    is_datetime = values.map(lambda value: isinstance(value, datetime))
+    parsed = pd.Series(pd.NaT, index=values.index, dtype="datetime64[ns]")
+    parsed[is_datetime] = pd.to_datetime(values[is_datetime])
+
+    remaining = ~is_datetime
+    strings = values.astype(str).str.strip()
+    # Lock the format of the first value for the whole column; the others only see its misses
+    formats = COLUMN_FORMATS
+    if remaining.any():
+        locked = sniff_format(strings[remaining].iloc[0])
+        if locked is not None:
+            formats = (locked,) + tuple(fmt for fmt in COLUMN_FORMATS if fmt != locked)
+    for fmt in formats:
+        if not remaining.any():
+            break
+        attempt = pd.to_datetime(strings[remaining], format=fmt, errors='coerce')
+        parsed[attempt.index] = parsed[attempt.index].fillna(attempt)
+        remaining = parsed.isna()
+
+    if remaining.any():
+        raise ValueError(f"Date format for {values[remaining].iloc[0]} is not recognized.")
+    return parsed
+
+def parse_amounts_cents(values):
+    """Convert a column of amount strings into absolute int64 cents."""
+    strings = pd.Series(values, dtype=object).reset_index(drop=True).astype(str)
+    cleaned = strings.str.replace(r'[^0-9.-]', '', regex=True).str.lstrip('-')
+    amounts = pd.to_numeric(cleaned, errors='coerce')
+    for amount_str in strings[amounts.isna()]:
+        print(f"Error converting amount: {amount_str} is not a valid number.")
+    return np.rint(amounts.fillna(0).to_numpy(dtype=float) * 100).astype(np.int64)
+
+def _frame_to_ledger(sheet_name, dates, amounts, descriptions, sources):
+    return pd.DataFrame({
+        "date": parse_dates(dates),
+        "cents": parse_amounts_cents(amounts),
+        "description": pd.Series(descriptions, dtype=object).fillna("").to_numpy(),
+        "source": pd.Series(sources, dtype=object).fillna("").to_numpy(),
+        "sheet": sheet_name,
+    })
+
+def _concat_ledger(frames, sheet_names):
+    if frames:
+        ledger = pd.concat(frames, ignore_index=True)
+    else:
+        ledger = pd.DataFrame({column: [] for column in LEDGER_COLUMNS})
+        ledger["date"] = ledger["date"].astype("datetime64[ns]")
+        ledger["cents"] = ledger["cents"].astype(np.int64)
+    ledger["sheet"] = pd.Categorical(ledger["sheet"], categories=sheet_names)
+    ledger["source"] = ledger["source"].astype("category")
+    return ledger
+
+def build_ledger(data):
+    """Build the columnar ledger from the {sheet: [entry dicts]} mapping used by calculating_balances."""
+    frames = []
+    for sheet_name, entries in data.items():
+        if not entries:
+            continue
+        frames.append(_frame_to_ledger(
+            sheet_name,
+            [entry["date"] for entry in entries],
+            [entry["amount"] for entry in entries],
+            [entry.get("description", "") for entry in entries],
+            [entry.get("source", "") for entry in entries],
+        ))
+    return _concat_ledger(frames, list(data.keys()))
+
+def read_ledger(file_path, sheets_to_read):
+    """Stream the category sheets of a workbook straight into the columnar ledger."""
+    columns = {sheet_name: ([], [], [], []) for sheet_name in sheets_to_read}
+    found = set()
+    try:
+        for sheet_name, _, rows in iter_sheet_rows(file_path):
+            if sheet_name not in columns:
+                continue
+            found.add(sheet_name)
+            dates, amounts, descriptions, sources = columns[sheet_name]
+            for row in rows:
+                row = tuple(row) + (None,) * (4 - len(row))
+                if row[0] is None or row[1] is None:
+                    continue  # Skip rows with missing essential data
+                dates.append(row[0])
+                amounts.append(row[1])
+                descriptions.append(row[2])
+                sources.append(row[3])
+    except FileNotFoundError:
+        print(f"Error: The file {file_path} was not found.")
+        return None
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        return None
+
+    frames = []
+    for sheet_name, sheet_columns in columns.items():
+        if sheet_name not in found:
+            print(f"Sheet {sheet_name} not found in the file.")
+        elif sheet_columns[0]:
+            frames.append(_frame_to_ledger(sheet_name, *sheet_columns))
+
+    return _concat_ledger(frames, list(sheets_to_read))
+
+def read_ledger_store(store, sheets_to_read, dataset="categorized"):
+    """Build the ledger from the categorized partitions of a TransactionStore, reading only the four ledger columns."""
+    frames = []
+    for sheet_name in sheets_to_read:
+        try:
+            frame = store.read_partition(dataset, sheet_name, columns=["Date", "Amount", "Description", "Source"])
+        except Exception as e:
+            print(f"An error occurred: {e}")
+            return None
+        if frame is None:
+            print(f"Sheet {sheet_name} not found in the store.")
+            continue
+        frame = frame[frame["Date"].notna() & frame["Amount"].notna()]  # Skip rows with missing essential data
+        if not frame.empty:
+            frames.append(_frame_to_ledger(sheet_name, frame["Date"], frame["Amount"], frame["Description"], frame["Source"]))
+
+    return _concat_ledger(frames, list(sheets_to_read))
+
+def sheet_totals(ledger):
+    """Total cents per sheet, computed with a single grouped aggregation."""
+    return ledger.groupby("sheet", observed=False)["cents"].sum()
+
+def period_start(start_date, index, period="week"):
+    # First day of the period with the given index
+    if period in PERIOD_DAYS:
+        return start_date + timedelta(days=index * PERIOD_DAYS[period])
+    months = PERIOD_MONTHS[period]
+    month_number = (start_date.year * 12 + start_date.month - 1) // months * months + index * months
+    return datetime(month_number // 12, month_number % 12 + 1, 1)
+
+def period_indices(dates, start_date, period="week"):
+    """Vectorized period index of each date, counted from the period holding start_date."""
+    dates = pd.DatetimeIndex(dates)
+    if period in PERIOD_DAYS:
+        days = (dates.values.astype("datetime64[D]") - np.datetime64(start_date, "D")).astype(np.int64)
+        return days // PERIOD_DAYS[period]
+    if period in PERIOD_MONTHS:
+        months = PERIOD_MONTHS[period]
+        month_numbers = dates.year.to_numpy(dtype=np.int64) * 12 + dates.month.to_numpy(dtype=np.int64) - 1
+        return month_numbers // months - (start_date.year * 12 + start_date.month - 1) // months
+    raise ValueError(f"Unknown period '{period}'. Use one of: day, week, month, quarter.")
+
+def period_balances(ledger, period="week", income_sheet="Income", expense_sheet="Expenses"):
+    """Income, expenses and balance per period as a DataFrame of cents."""
+    rows = ledger[ledger["sheet"].isin([income_sheet, expense_sheet])]
+    if rows.empty:
+        return pd.DataFrame(columns=["period_start", "income", "expenses", "balance"])
+
+    start_date = rows["date"].min().to_pydatetime()
+    indices = period_indices(rows["date"], start_date, period)
+    num_periods = int(indices.max()) + 1
+    cents = rows["cents"].to_numpy()
+    is_income = (rows["sheet"] == income_sheet).to_numpy()
+
+    income = np.bincount(indices[is_income], weights=cents[is_income], minlength=num_periods).astype(np.int64)
+    expenses = np.bincount(indices[~is_income], weights=cents[~is_income], minlength=num_periods).astype(np.int64)
+
+    return pd.DataFrame({
+        "period_start": [period_start(start_date, index, period) for index in range(num_periods)],
+        "income": income,
+        "expenses": expenses,
+        "balance": income - expenses,
+    })
@@ -0,0 +1,113 @@
+import asyncio
+import random
+import time
+from collections import deque
+
+# HTTP status codes worth retrying: rate limited or a transient server-side failure
+RETRY_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _encoding = None
+
+def estimate_tokens(text):
+    # tiktoken's cl100k is close to the llama3 tokenizer; without it, assume ~4 characters per token
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return len(text) // 4 + 1
+
+class TokenBucket:
+    """Allow `rate_per_minute` units per minute, refilled continuously, with bursts up to one minute's worth."""
+
+    def __init__(self, rate_per_minute):
+        self.rate_per_minute = rate_per_minute
+        self.available = float(rate_per_minute)
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.available = min(self.rate_per_minute, self.available + (now - self.updated) * self.rate_per_minute / 60)
+        self.updated = now
+
+    async def acquire(self, amount=1):
+        # A single request larger than the whole bucket still goes through once the bucket is full
+        amount = min(amount, self.rate_per_minute)
+        async with self.lock:
+            while True:
+                self._refill()
+                if self.available >= amount:
+                    self.available -= amount
+                    return
+                await asyncio.sleep((amount - self.available) * 60 / self.rate_per_minute)
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute limits shared by every in-flight call."""
+
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+
+    async def acquire(self, tokens):
+        await self.requests.acquire(1)
+        await self.tokens.acquire(tokens)
+
+def _status_code(error):
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status
+
+def _retry_after(error):
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+def is_retryable(error):
+    status = _status_code(error)
+    if status is not None:
+        return status in RETRY_STATUS_CODES
+    # Connection resets and timeouts carry no status code
+    return "Connection" in type(error).__name__ or "Timeout" in type(error).__name__
+
+async def call_with_retry(func, *args, retries=5, base_delay=1.0, max_delay=30.0, **kwargs):
+    """Await func(*args, **kwargs), retrying 429/5xx and connection errors with exponential backoff."""
+    for attempt in range(retries + 1):
+        try:
+            return await func(*args, **kwargs)
+        except Exception as e:
+            if attempt == retries or not is_retryable(e):
+                raise
+            delay = _retry_after(e)
+            if delay is None:
+                delay = min(max_delay, base_delay * 2 ** attempt) * (0.5 + random.random() / 2)
+            print(f"Request failed ({e}); retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+async def iter_ordered(jobs, worker, concurrency):
+    """Yield worker(job) for every job, in job order, with at most `concurrency` calls in flight.
+
+    Jobs are pulled lazily, so an unbounded generator of jobs is fine; only a
+    small window of finished-but-not-yet-yielded results is held in memory.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded(job):
+        async with semaphore:
+            return await worker(job)
+
+    pending = deque()
+    try:
+        for job in jobs:
+            pending.append(asyncio.ensure_future(bounded(job)))
+            if len(pending) >= concurrency * 2:
+                yield await pending.popleft()
+        while pending:
+            yield await pending.popleft()
+    finally:
+        for task in pending:
+            task.cancel()
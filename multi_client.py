@@ -0,0 +1,117 @@
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import newparser
+import pdfextractor
+import groqparser
+import calculating_balances
+from transaction_store import RAW, TransactionStore
+
+DEFAULT_CLIENTS_ROOT = "clients"
+
+class ClientWorkspace:
+    """Input and output paths of one client, all under clients/<name>.
+
+    clients/<name>/client_docs holds the statements and exports, and
+    clients/<name>/processed_files the store, manifests and categorization
+    cache. The exported workbook is clients/<name>/categorized_data.xlsx and
+    the balances are read from clients/<name>/account_balances.json. Nothing
+    is shared between clients.
+    """
+
+    def __init__(self, name, root=DEFAULT_CLIENTS_ROOT):
+        self.name = name
+        self.root = os.path.join(root, name)
+        self.docs_dir = os.path.join(self.root, "client_docs")
+        self.output_dir = os.path.join(self.root, "processed_files")
+        self.store = TransactionStore(os.path.join(self.output_dir, "store"))
+        self.cache_path = os.path.join(self.output_dir, "categorization_cache.sqlite")
+        self.workbook = os.path.join(self.root, "categorized_data.xlsx")
+        self.balances_path = os.path.join(self.root, calculating_balances.DEFAULT_BALANCES_PATH)
+
+def discover_clients(root=DEFAULT_CLIENTS_ROOT):
+    """Every directory under root with a client_docs folder, by name."""
+    if not os.path.isdir(root):
+        return []
+    return [
+        ClientWorkspace(name, root)
+        for name in sorted(os.listdir(root))
+        if os.path.isdir(os.path.join(root, name, "client_docs"))
+    ]
+
+def process_client_books(workspace):
+    """Parse, categorize and balance one client end to end. Runs in a worker process.
+
+    Returns a dict of timings and row counts; a failure is reported in it
+    instead of raised, so one client cannot stop the others.
+    """
+    start = time.perf_counter()
+    result = {"client": workspace.name, "status": "done", "rows": 0, "categorized": 0}
+    try:
+        # The pool already runs one client per core, so each client parses on one core
+        newparser.main(workspace.docs_dir, workspace.store, workers=1)
+        pdfextractor.main(workspace.docs_dir, workspace.store, workers=1)
+        result["rows"] = workspace.store.row_count(RAW)
+
+        # groqparser rebuilds the categorized rows from RAW, so a nightly rerun does not add to them
+        result["categorized"] = groqparser.main(workspace.store, workspace.workbook, workspace.cache_path)
+
+        if os.path.exists(workspace.balances_path):
+            account_balances = calculating_balances.load_account_balances(workspace.balances_path)
+        else:
+            print(f"No {workspace.balances_path}; computing {workspace.name}'s summary without account balances.")
+            account_balances = {}
+        if calculating_balances.process_client(workspace.workbook, account_balances, workspace.store) is None:
+            result["status"] = "no data"
+    except Exception as e:
+        print(f"Error processing client {workspace.name}: {e}")
+        result["status"] = "failed"
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+def _share_rate_limits(workers):
+    # Every worker talks to Groq with the same API key, so each gets an equal share of the limits
+    groqparser.requests_per_minute = max(1, groqparser.requests_per_minute // workers)
+    groqparser.tokens_per_minute = max(1, groqparser.tokens_per_minute // workers)
+    groqparser.concurrency = max(1, groqparser.concurrency // workers)
+
+def run_clients(workspaces, workers=1):
+    """Process many clients concurrently, one per worker process, and report throughput."""
+    start = time.perf_counter()
+    if workers > 1 and len(workspaces) > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_share_rate_limits, initargs=(workers,)) as executor:
+            results = list(executor.map(process_client_books, workspaces))
+    else:
+        results = [process_client_books(workspace) for workspace in workspaces]
+    report(results, time.perf_counter() - start)
+    return results
+
+def report(results, total):
+    print(f"\n{'Client':<21} {'Status':<9} {'Rows':>6} {'Categorized':>12} {'Wall time':>10}")
+    for result in results:
+        print(f"{result['client']:<21} {result['status']:<9} {result['rows']:>6} {result['categorized']:>12} {result['seconds']:9.2f}s")
+    rows = sum(result["rows"] for result in results)
+    done = sum(result["status"] == "done" for result in results)
+    print(f"{done} of {len(results)} clients done in {total:.2f}s: "
+          f"{len(results) / total * 60 if total else 0:.1f} clients/min, {rows / total if total else 0:.0f} rows/s")
+
+def main(argv=()):
+    parser = argparse.ArgumentParser(description="Run the whole pipeline for many clients, each in its own folder under --root.")
+    parser.add_argument("clients", nargs="*", help="client names to process (default: every client under --root)")
+    parser.add_argument("--root", default=DEFAULT_CLIENTS_ROOT, help="folder holding one sub-folder per client")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="clients processed at once")
+    args = parser.parse_args(argv)
+
+    if args.clients:
+        workspaces = [ClientWorkspace(name, args.root) for name in args.clients]
+    else:
+        workspaces = discover_clients(args.root)
+    if not workspaces:
+        print(f"No clients found under {args.root}; each needs a {os.path.join('<name>', 'client_docs')} folder.")
+        return
+    run_clients(workspaces, args.workers)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,59 +1,103 @@
 import os
+import time
+import shutil
+import tempfile
 import pandas as pd
 import pdfplumber  # New library for better PDF parsing
 import re
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from ingest_manifest import IngestManifest, default_manifest_path
+from source_adapters import CSV_ENGINE, PYARROW_MIN_BYTES, normalize_transactions, read_transactions_csv
+from transaction_store import RAW, TransactionStore
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 
-def parse_files_in_folder(folder_path, output_excel_path):
+def read_source_file(file_path, normalize=True):
+    """Parse one supported file into a DataFrame, or return None for unsupported file types.
+
+    With normalize=False CSV files are read whole with the default parser and
+    keep their own columns, as every run did before normalization existed.
+    """
+    # Check if the file is a PDF, TXT, or CSV
+    if file_path.endswith('.pdf'):
+        # Parse PDF
+        return parse_pdf(file_path)
+    if file_path.endswith('.txt'):
+        # Parse TXT
+        data = parse_txt(file_path)
+        if normalize and not data.empty:
+            data = normalize_transactions(data)
+        return data
+    if file_path.endswith('.csv'):
+        # Read CSV
+        return read_transactions_csv(file_path) if normalize else pd.read_csv(file_path)
+    # Skip if not a supported file type
+    return None
+
+def parse_files_in_folder(folder_path, store=None, manifest=None, workers=1, normalize=True):
     try:
-        # Ensure the output directory exists
-        output_dir = os.path.dirname(output_excel_path)
-        os.makedirs(output_dir, exist_ok=True)
-
-        # Create a Pandas Excel writer using openpyxl as the engine.
-        writer = pd.ExcelWriter(output_excel_path, engine='openpyxl')
-
-        # Loop through all files in the folder
-        for filename in os.listdir(folder_path):
-            if filename.endswith('-read'):  # Skip files ending with '-read'
-                continue
-            file_path = os.path.join(folder_path, filename)
-
-            # Check if the file is a PDF, TXT, or CSV
-            if filename.endswith('.pdf'):
-                # Parse PDF
-                data = parse_pdf(file_path)
-            elif filename.endswith('.txt'):
-                # Parse TXT
-                data = parse_txt(file_path)
-            elif filename.endswith('.csv'):
-                # Read CSV
-                data = pd.read_csv(file_path)
-            else:
-                # Skip if not a supported file type
+        store = store or TransactionStore()
+        manifest = manifest or IngestManifest("newparser", default_manifest_path("newparser", os.path.dirname(store.root)))
+        if not store.exists(RAW):
+            manifest.forget()
+
+        # Only files that are new or changed since the last run are read
+        file_paths = [
+            os.path.join(folder_path, filename)
+            for filename in sorted(os.listdir(folder_path))
+            if not manifest.is_current(os.path.join(folder_path, filename))
+        ]
+
+        # The pyarrow reader releases the GIL, so threads read several files at once.
+        # map() keeps results in file order.
+        if workers > 1 and len(file_paths) > 1:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(lambda file_path: read_source_file(file_path, normalize), file_paths))
+        else:
+            results = [read_source_file(file_path, normalize) for file_path in file_paths]
+
+        parsed = {}
+        for file_path, data in zip(file_paths, results):
+            if data is None:
                 continue
+            filename = os.path.basename(file_path)
 
             if data.empty:
                 logging.warning(f"No data extracted from file: {filename}")
+                parsed[file_path] = (None, data)
                 continue
 
-            data['Category'] = 'Category_Value'
-
-            # Write to Excel with sheet name as filename
-            sheet_name = os.path.splitext(filename)[0][:31]  # Use filename without extension as sheet name, limit to 31 chars
-            data.to_excel(writer, sheet_name=sheet_name, index=False)
-
-            # Rename the processed file with '-read' suffix before the extension
-            new_filename = f"{os.path.splitext(filename)[0]}-read{os.path.splitext(filename)[1]}"
-            os.rename(file_path, os.path.join(folder_path, new_filename))
-
-        # Save the Excel file
-        writer._save()
+            if 'Category' not in data:
+                data['Category'] = 'Category_Value'
+
+            # One raw partition per file, named after the whole filename without its extension;
+            # only export_excel cuts names to Excel's 31 characters
+            sheet_name = os.path.splitext(filename)[0]
+            parsed[file_path] = (sheet_name, data)
+
+        # A changed file's previous partition goes first, even when the file now parses to nothing
+        for file_path, (sheet_name, data) in parsed.items():
+            previous = (manifest.outputs(file_path) or {}).get("sheet")
+            if previous is not None and previous != sheet_name:
+                store.remove(RAW, previous)
+
+        sheets = [(sheet_name, data) for sheet_name, data in parsed.values() if sheet_name is not None]
+        if not sheets:
+            logging.info("No new or changed files in %s", folder_path)
+        else:
+            # Only the partitions of new or changed files are (re)written; every other one is kept
+            for sheet_name, data in sheets:
+                store.write(RAW, sheet_name, data)
+
+        for file_path, (sheet_name, data) in parsed.items():
+            manifest.record(file_path, {"sheet": sheet_name, "rows": len(data)})
+        manifest.save()
     except Exception as e:
+        # Raised so run_all does not count the stage as done
         logging.error(f"An error occurred while processing files: {e}")
+        raise
 
 def parse_pdf(file_path):
     rows = []
@@ -106,11 +150,48 @@ def parse_txt(file_path):
     data = pd.DataFrame(rows, columns=['Date', 'Description', 'Amount'])
     return data
 
-def main():
-    # Example usage
-    folder_path = 'client_docs'  # Use relative path
-    output_excel_path = 'processed_files/csv_extracted.xlsx'  # Use relative path
-    parse_files_in_folder(folder_path, output_excel_path)
+def benchmark(folder_path, workers, copies=10, repeat=3):
+    """Time serial against parallel ingestion of the same files, both normalizing, into a scratch store.
+
+    The CSV/TXT files of folder_path are copied `copies` times into a scratch
+    folder to stand in for a larger batch of exports. Each run writes to a fresh
+    store with an empty manifest, so every file is read, normalized and
+    written every time; the two paths differ only in the number of threads.
+    Returns the best time of each path in seconds.
+    """
+    timings = {}
+    with tempfile.TemporaryDirectory() as input_dir:
+        for filename in sorted(os.listdir(folder_path)):
+            if not filename.endswith(('.csv', '.txt')):
+                continue
+            stem, extension = os.path.splitext(filename)
+            for copy in range(copies):
+                shutil.copyfile(os.path.join(folder_path, filename), os.path.join(input_dir, f"{copy}_{stem}{extension}"))
+
+        for label, options in (("serial", dict(workers=1)), ("parallel", dict(workers=workers))):
+            best = None
+            for _ in range(repeat):
+                with tempfile.TemporaryDirectory() as output_dir:
+                    store = TransactionStore(os.path.join(output_dir, 'store'))
+                    manifest = IngestManifest("newparser", default_manifest_path("newparser", output_dir))
+                    start = time.perf_counter()
+                    parse_files_in_folder(input_dir, store, manifest, **options)
+                    elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            timings[label] = best
+            print(f"{label:>8}: {best:.3f}s (best of {repeat})")
+    print(f"CSV engine: {CSV_ENGINE} for files from {PYARROW_MIN_BYTES // 1024} KiB, C below; workers: {workers}, files: {copies}x, "
+          f"speedup: {timings['serial'] / timings['parallel']:.2f}x")
+    return timings
+
+def main(folder_path='client_docs', store=None, workers=None):
+    # Paths default to the single-client layout; multi_client passes each client's own
+    workers = workers or int(os.getenv("CSV_WORKERS", os.cpu_count() or 1))
+    parse_files_in_folder(folder_path, store or TransactionStore(), workers=workers)
 
 if __name__ == "__main__":
-    main()
+    import sys
+    if "--benchmark" in sys.argv:
+        benchmark('client_docs', int(os.getenv("CSV_WORKERS", os.cpu_count() or 1)))
+    else:
+        main()
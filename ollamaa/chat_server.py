@@ -0,0 +1,255 @@
+import argparse
+import asyncio
+import json
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from urllib.parse import parse_qs, urlsplit
+import ollama
+try:
+    from .chatbot import CHAT_MODEL, COLLECTION_NAME, ChatSession, build_model_query
+    from .ledger_queries import LedgerAggregates
+except ImportError:  # Run as a script from inside ollamaa
+    from chatbot import CHAT_MODEL, COLLECTION_NAME, ChatSession, build_model_query
+    from ledger_queries import LedgerAggregates
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8080
+# Generations llama3 runs at once; more only split the same GPU/CPU between them
+DEFAULT_MAX_GENERATIONS = 2
+# Questions allowed to wait for a generation slot before new ones are turned away
+DEFAULT_MAX_QUEUE = 16
+# Sessions remembered for /stats; the least recently seen are forgotten beyond this
+DEFAULT_MAX_SESSIONS = 1000
+
+NO_ANSWER = "That's all I could find, Please be a little more descriptive for accurate results."
+
+async def stream_generation(prompt):
+    """Yield llama3's tokens as they arrive, running the blocking ollama stream in a worker thread."""
+    loop = asyncio.get_running_loop()
+    tokens = asyncio.Queue()
+    finished = object()
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for chunk in ollama.generate(model=CHAT_MODEL, prompt=prompt, stream=True):
+                if stop.is_set():
+                    break
+                loop.call_soon_threadsafe(tokens.put_nowait, chunk.get("response", ""))
+        except Exception as e:
+            loop.call_soon_threadsafe(tokens.put_nowait, e)
+        finally:
+            loop.call_soon_threadsafe(tokens.put_nowait, finished)
+
+    loop.run_in_executor(None, produce)
+    try:
+        while True:
+            item = await tokens.get()
+            if item is finished:
+                return
+            if isinstance(item, Exception):
+                raise item
+            if item:
+                yield item
+    finally:
+        # The client went away or the caller stopped reading; end the generation early
+        stop.set()
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else None
+
+class ChatService:
+    """The chatbot's ledger-then-retrieval-then-llama3 flow, shared by every connected session.
+
+    All sessions share one ChatSession, so they share its Chroma handle and
+    its embedding and retrieval caches. At most max_generations questions are
+    retrieved and generated at once; up to max_queue more wait their turn and
+    any beyond that are told the server is busy.
+    """
+
+    def __init__(self, collection_name=COLLECTION_NAME, max_generations=DEFAULT_MAX_GENERATIONS, max_queue=DEFAULT_MAX_QUEUE, workbook_path=None):
+        self.chat = ChatSession(collection_name)
+        self.aggregates = LedgerAggregates(workbook_path) if workbook_path else LedgerAggregates()
+        self.aggregates_lock = threading.Lock()
+        self.max_generations = max_generations
+        self.max_queue = max_queue
+        self.slots = asyncio.Semaphore(max_generations)
+        self.waiting = 0
+        self.active = 0
+        self.sessions = OrderedDict()
+        self.max_sessions = DEFAULT_MAX_SESSIONS
+        self.first_token_ms = deque(maxlen=1000)
+
+    def _ledger_answer(self, question):
+        with self.aggregates_lock:
+            return self.aggregates.answer(question)
+
+    async def ask(self, session_id, question, send):
+        """Answer one question, handing each piece of the answer to send(event, data) as soon as it exists."""
+        start = time.perf_counter()
+        session = self.sessions.setdefault(session_id, {"questions": 0})
+        session["questions"] += 1
+        session["last_seen"] = time.time()
+        # Most recently seen last; requests without a session id each start a new one
+        self.sessions.move_to_end(session_id)
+        while len(self.sessions) > self.max_sessions:
+            self.sessions.popitem(last=False)
+        timings = {"session": session_id}
+        try:
+            await self._answer(question, send, start, timings)
+        except ConnectionError:
+            raise  # The client is gone; there is nobody to tell
+        except Exception as e:
+            # Ollama down, model missing, Chroma unreachable: end the stream with an error instead of cutting it off
+            print(f"[{session_id}] Error answering: {e}")
+            await send("error", {"message": f"Could not answer the question: {e}", **timings})
+
+    async def _answer(self, question, send, start, timings):
+        def first_token():
+            if "first_token_ms" not in timings:
+                timings["first_token_ms"] = round((time.perf_counter() - start) * 1000, 1)
+                self.first_token_ms.append(timings["first_token_ms"])
+
+        answer = await asyncio.to_thread(self._ledger_answer, question)
+        if answer:
+            first_token()
+            await send("token", {"text": answer})
+            timings["source"] = "ledger"
+        else:
+            if self.waiting >= self.max_queue:
+                await send("error", {"message": "The server is busy, please ask again in a moment."})
+                return
+            self.waiting += 1
+            try:
+                await self.slots.acquire()
+            finally:
+                self.waiting -= 1
+            self.active += 1
+            try:
+                timings["queued_ms"] = round((time.perf_counter() - start) * 1000, 1)
+                document = await asyncio.to_thread(self.chat.lookup, question)
+                timings["source"] = "rag"
+                if not document:
+                    first_token()
+                    await send("token", {"text": NO_ANSWER})
+                else:
+                    tokens = stream_generation(build_model_query(question, document))
+                    try:
+                        async for token in tokens:
+                            first_token()
+                            await send("token", {"text": token})
+                    finally:
+                        await tokens.aclose()
+            finally:
+                self.active -= 1
+                self.slots.release()
+
+        timings["total_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        print(f"[{timings['session']}] {timings['source']}: first token {timings.get('first_token_ms')} ms, done in {timings['total_ms']} ms")
+        await send("done", timings)
+
+    def stats(self):
+        return {
+            "sessions": len(self.sessions),
+            "active_generations": self.active,
+            "waiting": self.waiting,
+            "max_generations": self.max_generations,
+            "max_queue": self.max_queue,
+            "first_token_ms_p50": percentile(self.first_token_ms, 0.5),
+            "first_token_ms_p95": percentile(self.first_token_ms, 0.95),
+        }
+
+async def read_request(reader):
+    """(method, path, query, body) of one HTTP/1.1 request."""
+    request_line = (await reader.readline()).decode("latin-1").strip()
+    if not request_line:
+        return None
+    method, target, _ = request_line.split(" ", 2)
+    headers = {}
+    while True:
+        line = (await reader.readline()).decode("latin-1")
+        if line in ("\r\n", "\n", ""):
+            break
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+    body = await reader.readexactly(int(headers.get("content-length", 0) or 0))
+    url = urlsplit(target)
+    query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+    return method.upper(), url.path, query, body
+
+async def write_json(writer, status, payload):
+    body = json.dumps(payload).encode("utf-8")
+    writer.write(f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("latin-1") + body)
+    await writer.drain()
+
+def make_handler(service):
+    async def handle(reader, writer):
+        try:
+            request = await read_request(reader)
+            if request is None:
+                return
+            method, path, query, body = request
+            if path == "/stats" and method == "GET":
+                await write_json(writer, "200 OK", service.stats())
+                return
+            if path != "/chat" or method not in ("GET", "POST"):
+                await write_json(writer, "404 Not Found", {"error": "Use POST /chat, GET /chat?q=... or GET /stats."})
+                return
+
+            # POST takes {"question": ..., "session": ...}; GET takes ?q=...&session=... for EventSource clients
+            fields = query
+            if method == "POST" and body:
+                try:
+                    fields = json.loads(body)
+                except json.JSONDecodeError:
+                    fields = None
+                if not isinstance(fields, dict):
+                    await write_json(writer, "400 Bad Request", {"error": "The body must be a JSON object."})
+                    return
+            question = str(fields.get("question") or fields.get("q") or "").strip()
+            if not question:
+                await write_json(writer, "400 Bad Request", {"error": "No question given."})
+                return
+            session_id = str(fields.get("session") or uuid.uuid4().hex[:12])
+
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\nConnection: close\r\n\r\n")
+
+            async def send(event, data):
+                writer.write(f"event: {event}\ndata: {json.dumps(data)}\n\n".encode("utf-8"))
+                await writer.drain()
+
+            await service.ask(session_id, question, send)
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass  # The client disconnected or sent something that is not HTTP
+        except Exception as e:
+            print(f"Error answering a request: {e}")
+        finally:
+            writer.close()
+    return handle
+
+async def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, max_generations=DEFAULT_MAX_GENERATIONS, max_queue=DEFAULT_MAX_QUEUE, collection_name=COLLECTION_NAME):
+    service = ChatService(collection_name, max_generations, max_queue)
+    await asyncio.to_thread(service.aggregates.refresh)  # Precompute the totals before the first question
+    server = await asyncio.start_server(make_handler(service), host, port)
+    print(f"Chat server listening on http://{host}:{port}/chat ({max_generations} generations at once, {max_queue} queued)")
+    async with server:
+        await server.serve_forever()
+
+def main(argv=()):
+    parser = argparse.ArgumentParser(description="Serve the chatbot to many users at once, streaming answers as server-sent events.")
+    parser.add_argument("--host", default=DEFAULT_HOST, help="address to listen on (0.0.0.0 to accept other machines)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--max-generations", type=int, default=DEFAULT_MAX_GENERATIONS, help="answers generated at once")
+    parser.add_argument("--max-queue", type=int, default=DEFAULT_MAX_QUEUE, help="questions allowed to wait for a free generation")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args.host, args.port, args.max_generations, args.max_queue))
+    except KeyboardInterrupt:
+        print("Chat server stopped.")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
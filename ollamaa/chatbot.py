@@ -1,29 +1,100 @@
-import chromadb
 import ollama
-import json
+import re
+import time
+from functools import lru_cache
+try:
+    from .context_builder import DEFAULT_TOKEN_BUDGET, build_context
+    from .ledger_queries import LedgerAggregates
+    from .vector_store import open_client
+except ImportError:  # Run as a script from inside ollamaa
+    from context_builder import DEFAULT_TOKEN_BUDGET, build_context
+    from ledger_queries import LedgerAggregates
+    from vector_store import open_client
 
-# Function to initialize ChromaDB connection
+# Documents retrieved per question; build_context trims them to the token budget
+DEFAULT_N_RESULTS = 40
+# Distinct questions whose embedding and retrieval results a session remembers
+DEFAULT_CACHE_SIZE = 256
+CHAT_MODEL = 'llama3'
+COLLECTION_NAME = "buildragwithpython"
+
+# Function to initialize ChromaDB connection; the backend (HTTP server, embedded Chroma or numpy) comes from config.ini
 def initialize_chromadb():
     try:
-        chroma = chromadb.HttpClient(host="localhost", port=8000)
+        chroma = open_client()
         return chroma
-    except ImportError:
-        print("ChromaDB module not found.")
+    except ImportError as e:
+        print(e)
         return None
 
 # Function to retrieve data from ChromaDB based on embeddings
-def retrieve_data_from_chromadb(embeddings, collection_name):
-    chroma = initialize_chromadb()
-    if chroma:
-        collection = chroma.get_collection(collection_name)
-        result = collection.query(query_embeddings=[embeddings], n_results=1)
-        if result and result.get("documents"):
-            document = json.loads(result["documents"][0][0])
-            return document
+def retrieve_data_from_chromadb(embeddings, collection_name, n_results=DEFAULT_N_RESULTS, collection=None, question="", token_budget=DEFAULT_TOKEN_BUDGET):
+    if collection is None:
+        chroma = initialize_chromadb()
+        collection = chroma.get_collection(collection_name) if chroma else None
+    if collection is not None:
+        result = collection.query(query_embeddings=[embeddings], n_results=n_results)
+        if result and result.get("documents") and result["documents"][0]:
+            # The closest documents, most relevant first, compacted into a table that fits the budget
+            documents = result["documents"][0]
+            metadatas = (result.get("metadatas") or [None])[0] or [None] * len(documents)
+            return build_context(list(zip(documents, metadatas)), question, token_budget)
     return None
 
+def normalize_question(text):
+    """Cache key for a question: lowercase, single spaces, no trailing punctuation."""
+    return re.sub(r'\s+', ' ', text.strip().lower()).rstrip('?!. ')
+
+class ChatSession:
+    """One chatbot session: a single Chroma client and collection handle, plus LRU caches.
+
+    Embeddings and retrieval results are cached by normalized question, so a
+    repeated question skips both the embedding call and the Chroma query. The
+    retrieval cache is cleared whenever the collection's document count
+    changes, as it does when search.py or import.py re-syncs it.
+    """
+
+    def __init__(self, collection_name, embedmodel='nomic-embed-text', n_results=DEFAULT_N_RESULTS, cache_size=DEFAULT_CACHE_SIZE, token_budget=DEFAULT_TOKEN_BUDGET):
+        self.collection_name = collection_name
+        self.embedmodel = embedmodel
+        self.n_results = n_results
+        self.token_budget = token_budget
+        self.chroma = initialize_chromadb()
+        self.collection = None
+        self.collection_count = None
+        self.embed = lru_cache(maxsize=cache_size)(self._embed)
+        self.retrieve = lru_cache(maxsize=cache_size)(self._retrieve)
+
+    def _collection(self):
+        # Opened on first use and kept for the rest of the session
+        if self.collection is None and self.chroma:
+            self.collection = self.chroma.get_collection(self.collection_name)
+        return self.collection
+
+    def _embed(self, question):
+        return tuple(ollama.embeddings(model=self.embedmodel, prompt=question)["embedding"])
+
+    def _retrieve(self, question):
+        return retrieve_data_from_chromadb(list(self.embed(question)), self.collection_name, self.n_results, self._collection(), question, self.token_budget)
+
+    def lookup(self, question):
+        """Documents relevant to question, from the cache when it was asked before and the collection is unchanged."""
+        collection = self._collection()
+        count = collection.count() if collection is not None else None
+        if count != self.collection_count:
+            self.retrieve.cache_clear()
+            self.collection_count = count
+        return self.retrieve(normalize_question(question))
+
+def build_model_query(user_input, document):
+    """Prompt asking the model to answer user_input from the retrieved document."""
+    return f"{user_input} - Answer that question using the following text as a resource and make sure that you always respond in the most human way possible. refrain from giving table like information or json structures, always provide sentences paragraphs and summaries using the resource. Form intelligent sentences giving an impression that you're it's Accountant. \n: {document}"
+
 # Function to interact with the chatbot
-def chatbot(collection_name):
+def chatbot(collection_name, workbook_path=None):
+    session = ChatSession(collection_name)
+    aggregates = LedgerAggregates(workbook_path) if workbook_path else LedgerAggregates()
+    aggregates.refresh()  # Precompute the totals before the first question
     while True:
         user_input = input("You: ").strip().lower()
 
@@ -32,17 +103,22 @@ def chatbot(collection_name):
             print("Chatbot: Goodbye!")
             break
 
-        response = ollama.embeddings(model='nomic-embed-text', prompt=user_input)
-        embeddings = response["embedding"]
+        # Totals, per-category, per-month and top-merchant questions are answered from the ledger directly
+        start = time.perf_counter()
+        answer = aggregates.answer(user_input)
+        if answer:
+            print(f"Chatbot: {answer}")
+            print(f"({(time.perf_counter() - start) * 1000:.0f} ms, from categorized_data.xlsx)")
+            continue
 
-        # Retrieve data from ChromaDB based on generated embeddings
-        document = retrieve_data_from_chromadb(embeddings, collection_name)
+        # Retrieve data from ChromaDB based on generated embeddings; repeated questions come from the cache
+        document = session.lookup(user_input)
 
         # If data found, print it
         if document:
             print("Chatbot: Here is the information I found:")
-            modelquery = f"{user_input} - Answer that question using the following text as a resource and make sure that you always respond in the most human way possible. refrain from giving table like information or json structures, always provide sentences paragraphs and summaries using the resource. Form intelligent sentences giving an impression that you're it's Accountant. \n: {document}"
-            stream = ollama.generate(model='llama3', prompt=modelquery, stream=True)
+            modelquery = build_model_query(user_input, document)
+            stream = ollama.generate(model=CHAT_MODEL, prompt=modelquery, stream=True)
             for chunk in stream:
                 if chunk["response"]:
                     print(chunk['response'], end='', flush=True)
@@ -51,8 +127,7 @@ def chatbot(collection_name):
 
 # Main function
 def main():
-    collection_name = "buildragwithpython"  
-    chatbot(collection_name)
+    chatbot(COLLECTION_NAME)
 
 if __name__ == "__main__":
     main()
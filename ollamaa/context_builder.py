@@ -0,0 +1,133 @@
+import os
+import re
+import sys
+from collections import defaultdict
+try:
+    from date_parser import parse_date
+    from llm_scheduler import estimate_tokens
+except ImportError:  # Run as a script from inside ollamaa; the shared parsers live one folder up
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from date_parser import parse_date
+    from llm_scheduler import estimate_tokens
+
+# Tokens of retrieved context handed to llama3 per question, whatever the ledger size
+DEFAULT_TOKEN_BUDGET = 1200
+# More retrieved transactions than this get per-category sums ahead of the table
+SUMMARIZE_ABOVE = 12
+DESCRIPTION_WIDTH = 40
+
+def _parse_date(value):
+    try:
+        return parse_date(value)
+    except ValueError:
+        return None
+
+def short_description(document, metadata):
+    """The description part of a transaction document, without its reference noise."""
+    # transaction_document writes "<date>, <category> transaction, <description>, source <source>, amount <amount>"
+    parts = document.split(", ")
+    text = ", ".join(part for part in parts[2:] if not part.startswith(("source ", "amount ")))
+    text = re.split(r'%%| ID:| DATA:', text)[0]
+    text = re.sub(r'\s+', ' ', text).strip()
+    return text[:DESCRIPTION_WIDTH] or "-"
+
+def _transaction_rows(results):
+    rows = []
+    for document, metadata in results:
+        metadata = metadata or {}
+        if "amount" not in metadata or "category" not in metadata:
+            continue
+        rows.append({
+            "date": metadata.get("date", ""),
+            "category": metadata["category"],
+            # Signed, so refunds and credits offset the charges in the sums below
+            "amount": float(metadata["amount"]),
+            "description": short_description(document, metadata),
+            "source": metadata.get("source", ""),
+        })
+    return rows
+
+def group_totals(rows):
+    """Lines of sums per category, and per week within a category when it spans several weeks.
+
+    The sums cover only the retrieved transactions, and the lines say so, so
+    the model does not repeat them as the category's total in the ledger.
+    """
+    by_category = defaultdict(list)
+    for row in rows:
+        by_category[row["category"]].append(row)
+    lines = []
+    for category, category_rows in sorted(by_category.items(), key=lambda item: -abs(sum(row["amount"] for row in item[1]))):
+        total = sum(row["amount"] for row in category_rows)
+        lines.append(f"{category}: {len(category_rows)} matching transactions, summing to {total:.2f}")
+        weeks = defaultdict(float)
+        for row in category_rows:
+            date = _parse_date(row["date"])
+            if date:
+                weeks[date.strftime("%G-W%V")] += row["amount"]
+        if len(weeks) > 1 and len(category_rows) > SUMMARIZE_ABOVE:
+            lines.append("  by week: " + "; ".join(f"{week} {amount:.2f}" for week, amount in sorted(weeks.items())))
+    return lines
+
+def transaction_table(rows, question=""):
+    """(header lines, one "|"-separated line per transaction), leaving out columns that say nothing.
+
+    A column with the same value on every row is stated once above the table
+    instead, and the source is only kept when the question mentions one that
+    is not also a category name.
+    """
+    columns = ["date", "category", "amount", "description", "source"]
+    fixed = []
+    for column in ("category", "source"):
+        values = {row[column] for row in rows}
+        if len(values) == 1:
+            value = values.pop()
+            if value:
+                fixed.append(f"{column}: {value}")
+            columns.remove(column)
+    categories = {row["category"].lower().rstrip("s") for row in rows}
+    sources = {row["source"].lower() for row in rows if row["source"]} - {""}
+    if "source" in columns and not any(source in question.lower() and source.rstrip("s") not in categories for source in sources):
+        columns.remove("source")
+    lines = ["|".join(f"{row[column]:.2f}" if column == "amount" else str(row[column]) for column in columns) for row in rows]
+    return fixed + ["|".join(columns)], lines
+
+def build_context(results, question="", token_budget=DEFAULT_TOKEN_BUDGET):
+    """Compact text of retrieved (document, metadata) pairs that fits in token_budget.
+
+    Transactions become a terse table, most relevant first, after per-category
+    (and per-week) sums of them when there are many; other documents such as
+    report rows follow as they are. Once a line would exceed the budget, the
+    rest of its section is left out and counted in a closing note.
+    """
+    rows = _transaction_rows(results)
+    others = [document for document, metadata in results if "amount" not in (metadata or {}) or "category" not in (metadata or {})]
+
+    # Each section is (heading lines, body lines); a heading is only written with at least one body line
+    sections = []
+    if len(rows) > SUMMARIZE_ABOVE:
+        sections.append((["Sums of the transactions below only, not ledger totals:"], group_totals(rows)))
+    if rows:
+        head, body = transaction_table(rows, question)
+        sections.append((["Transactions:"] + head, body))
+    if others:
+        sections.append((["Other:"], others))
+
+    lines = []
+    used = 0
+    skipped = 0
+    for head, body in sections:
+        head_cost = sum(estimate_tokens(line) for line in head)
+        for index, line in enumerate(body):
+            cost = estimate_tokens(line) + (head_cost if index == 0 else 0)
+            if used + cost > token_budget:
+                # The rest of the section is less relevant than what is already in
+                skipped += len(body) - index
+                break
+            if index == 0:
+                lines.extend(head)
+            lines.append(line)
+            used += cost
+    if skipped:
+        lines.append(f"({skipped} more lines left out to keep the context short)")
+    return "\n".join(lines)
@@ -0,0 +1,101 @@
+import hashlib
+import ollama
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_BATCH_SIZE = 64
+DEFAULT_CONCURRENCY = 4
+
+def batched(items, batch_size):
+    for start in range(0, len(items), batch_size):
+        yield items[start:start + batch_size]
+
+def embed_batch(model, texts):
+    # Newer ollama clients embed a whole list in one request; older ones only take one prompt
+    if hasattr(ollama, "embed"):
+        return ollama.embed(model=model, input=texts)["embeddings"]
+    return [ollama.embeddings(model=model, prompt=text)["embedding"] for text in texts]
+
+def embed_all(model, texts, batch_size=DEFAULT_BATCH_SIZE, concurrency=DEFAULT_CONCURRENCY):
+    """Embed texts in batches of batch_size with up to concurrency batches in flight, keeping their order."""
+    texts = list(texts)
+    batches = list(batched(texts, batch_size))
+    if concurrency > 1 and len(batches) > 1:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(lambda batch: embed_batch(model, batch), batches))
+    else:
+        results = [embed_batch(model, batch) for batch in batches]
+    return [embedding for result in results for embedding in result]
+
+def upsert_in_batches(collection, ids, embeddings, documents, metadatas=None, batch_size=DEFAULT_BATCH_SIZE):
+    """Write records with one collection.upsert per batch_size records instead of one per record."""
+    for start in range(0, len(ids), batch_size):
+        end = start + batch_size
+        collection.upsert(
+            ids=ids[start:end],
+            embeddings=embeddings[start:end],
+            documents=documents[start:end],
+            metadatas=metadatas[start:end] if metadatas else None,
+        )
+
+def chunk_id(source, text):
+    """Stable ID from a chunk's source and content, so an unchanged chunk keeps its ID across runs."""
+    source_digest = hashlib.sha256(source.encode("utf-8")).hexdigest()[:16]
+    return f"{source_digest}-{hashlib.sha256(text.encode('utf-8')).hexdigest()}"
+
+def existing_ids(collection, where=None, page_size=10000):
+    """Every ID stored in the collection (or matching where), fetched a page at a time without documents or embeddings."""
+    ids = set()
+    offset = 0
+    while True:
+        page = collection.get(where=where, include=[], limit=page_size, offset=offset)["ids"]
+        ids.update(page)
+        if len(page) < page_size:
+            return ids
+        offset += page_size
+
+def remove_untagged(collection, tag="origin", batch_size=DEFAULT_BATCH_SIZE, page_size=10000):
+    """Delete documents that have no tag metadata, returning how many were deleted.
+
+    Every writer now tags what it stores. Untagged documents are left over
+    from earlier versions, which stored whole sheets as one JSON document
+    (excel_data_<sheet>) and untagged text chunks. where filters can never
+    match them, so sync_collection would otherwise keep them forever.
+    """
+    untagged = []
+    offset = 0
+    while True:
+        page = collection.get(include=["metadatas"], limit=page_size, offset=offset)
+        untagged.extend(record_id for record_id, metadata in zip(page["ids"], page["metadatas"] or [None] * len(page["ids"]))
+                        if not metadata or tag not in metadata)
+        if len(page["ids"]) < page_size:
+            break
+        offset += page_size
+    for batch in batched(untagged, batch_size):
+        collection.delete(ids=batch)
+    return len(untagged)
+
+def sync_collection(collection, records, model, batch_size=DEFAULT_BATCH_SIZE, concurrency=DEFAULT_CONCURRENCY, where=None):
+    """Make the collection hold exactly records, embedding only the ones it does not have yet.
+
+    records maps ID to (document, metadata). IDs already stored are left
+    untouched and IDs no longer in records are deleted. When where is given,
+    only stored documents matching that metadata filter are considered, so
+    several writers can share one collection. Returns the counts of
+    (added, deleted, unchanged) records.
+    """
+    stored = existing_ids(collection, where)
+    new_ids = [record_id for record_id in records if record_id not in stored]
+    removed_ids = sorted(stored.difference(records))
+
+    documents = [records[record_id][0] for record_id in new_ids]
+    metadatas = [records[record_id][1] for record_id in new_ids]
+    if new_ids:
+        embeddings = embed_all(model, documents, batch_size, concurrency)
+        upsert_in_batches(collection, new_ids, embeddings, documents, metadatas, batch_size)
+    for batch in batched(removed_ids, batch_size):
+        collection.delete(ids=batch)
+    # Collections that buffer their writes (the numpy backend) save once here instead of once per batch
+    flush = getattr(collection, "flush", None)
+    if flush:
+        flush()
+    return len(new_ids), len(removed_ids), len(records) - len(new_ids)
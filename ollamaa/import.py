@@ -1,27 +1,40 @@
-import ollama, chromadb, time
+import ollama, time
 from utilities import readtext, getconfig
 from mattsollamatools import chunker, chunk_text_by_sentences
+from embedding_batch import DEFAULT_BATCH_SIZE, DEFAULT_CONCURRENCY, chunk_id, remove_untagged, sync_collection
+from vector_store import open_client
 
 collectionname="buildragwithpython"
 
-chroma = chromadb.HttpClient(host="localhost", port=8000)
+# Chroma server, embedded Chroma or the numpy index, as set by vectorstore in config.ini
+chroma = open_client()
 print(chroma.list_collections())
-if any(collection.name == collectionname for collection in chroma.list_collections()):
-  print('deleting collection')
-  chroma.delete_collection("buildragwithpython")
+# The collection is kept between runs; only chunks whose content changed are re-embedded
 collection = chroma.get_or_create_collection(name="buildragwithpython", metadata={"hnsw:space": "cosine"})
 
-embedmodel = getconfig()["embedmodel"]
+config = getconfig()["main"]
+embedmodel = config["embedmodel"]
+batchsize = int(config.get("embedbatchsize", DEFAULT_BATCH_SIZE))
+concurrency = int(config.get("embedconcurrency", DEFAULT_CONCURRENCY))
 starttime = time.time()
+
+# Chunk every document first, then embed and store the new chunks in batches
+records = {}
 with open('sourcedocs.txt') as f:
   lines = f.readlines()
   for filename in lines:
     text = readtext(filename)
     chunks = chunk_text_by_sentences(source_text=text, sentences_per_chunk=7, overlap=0 )
     print(f"with {len(chunks)} chunks")
-    for index, chunk in enumerate(chunks):
-      embed = ollama.embeddings(model=embedmodel, prompt=chunk)['embedding']
-      print(".", end="", flush=True)
-      collection.add([filename+str(index)], [embed], documents=[chunk], metadatas={"source": filename})
-    
-print("--- %s seconds ---" % (time.time() - starttime))
\ No newline at end of file
+    source = filename.strip()
+    for chunk in chunks:
+      records[chunk_id(source, chunk)] = (chunk, {"origin": "sourcedocs", "source": source})
+
+# Chunks stored before they were tagged with an origin are replaced by the tagged ones below
+legacy = remove_untagged(collection)
+if legacy:
+  print(f"Deleted {legacy} untagged documents left by an earlier version")
+added, deleted, unchanged = sync_collection(collection, records, embedmodel, batchsize, concurrency, where={"origin": "sourcedocs"})
+print(f"Embedded {added} new or changed chunks, deleted {deleted} removed ones, kept {unchanged} unchanged")
+
+print("--- %s seconds ---" % (time.time() - starttime))
@@ -0,0 +1,266 @@
+import os
+import re
+import sys
+import calendar
+import pandas as pd
+try:
+    from ledger import read_ledger
+except ImportError:  # Run as a script from inside ollamaa; the shared ledger code lives one folder up
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from ledger import read_ledger
+
+DEFAULT_WORKBOOK_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "categorized_data.xlsx")
+
+INCOME_SHEET = "Income"
+# Sheets holding categorized transactions; every one but Income counts as spending
+CATEGORY_SHEETS = ("Income", "Expenses", "Business Expenses", "Tax Deductible Expenses", "Subscriptions", "Uncertain Expenses")
+SUMMARY_SHEET = "Balance Summary"
+
+# Words that name a sheet without spelling it out
+CATEGORY_ALIASES = {
+    "subscription": "Subscriptions",
+    "business": "Business Expenses",
+    "tax": "Tax Deductible Expenses",
+    "deductible": "Tax Deductible Expenses",
+    "uncertain": "Uncertain Expenses",
+    "income": "Income",
+    "earn": "Income",
+    "earned": "Income",
+    "earnings": "Income",
+    "received": "Income",
+}
+
+MONTHS = {name.lower(): number for number, name in enumerate(calendar.month_name) if name}
+MONTHS.update({name.lower(): number for number, name in enumerate(calendar.month_abbr) if name})
+MONTH_PATTERN = re.compile(r'\b(' + '|'.join(sorted(MONTHS, key=len, reverse=True)) + r')\b(?:\s+(\d{4}))?')
+YEAR_PATTERN = re.compile(r'\b(20\d{2}|19\d{2})\b')
+# Periods period() cannot resolve to calendar months of the data; questions naming one go to the LLM
+RELATIVE_PERIOD_PATTERN = re.compile(r'\b(last|this|next|past|previous|current|recent|since|until|till|before|after|between|through|ytd|today|yesterday|days?|weeks?|weekly|weekend|fortnight|quarters?|quarterly|q[1-4]|half)\b')
+
+AGGREGATE_WORDS = re.compile(r'\b(how much|total|sum|spent|spend|spending|earn|earned|top|biggest|largest|most|breakdown|per|by|each|monthly|net income|budget|balance)\b')
+TOP_PATTERN = re.compile(r'\b(top|biggest|largest|most)\b.*\b(merchants?|vendors?|payees?|places|stores?|descriptions?)\b|\bwhere did i (spend|pay)\b')
+BY_CATEGORY_PATTERN = re.compile(r'\b(by|per|each) categor(y|ies)\b|\bbreakdown\b|\bcategories\b')
+BY_MONTH_PATTERN = re.compile(r'\b(by|per|each|every) month\b|\bmonthly\b|\bmonth by month\b')
+TOTAL_PATTERN = re.compile(r'\b(how much|total|sum|spent|spend|spending|earn|earned|received)\b')
+COUNT_PATTERN = re.compile(r'\bhow many\b')
+
+# Words of an aggregate question that name neither a category nor a merchant
+STOPWORDS = set("""
+how much many did do does i me my we our you spend spent spending pay paid on in at to for from with the a an
+what was is are were all of and or during per by each every month months monthly year years yearly total sum
+top biggest largest most merchant merchants vendor vendors payee payees place places store stores where which
+category categories breakdown transaction transactions money earn earned receive received have has give show
+tell list this last so far overall altogether expense expenses dollars get got made make cost costs amount
+""".split())
+
+def merchant_name(description):
+    """Short merchant name from a bank description: the text before the reference noise, without digits."""
+    text = re.split(r'%%| : | CO:| ID:| DATA:', str(description))[0]
+    words = re.sub(r'[^A-Za-z&.\' ]+', ' ', text).split()
+    return " ".join(words[:3]).upper() or "UNKNOWN"
+
+def format_dollars(cents):
+    return f"{'-' if cents < 0 else ''}${abs(cents) / 100:,.2f}"
+
+class LedgerAggregates:
+    """Totals over categorized_data.xlsx, precomputed once so numeric questions never reach the LLM.
+
+    The workbook is reduced to a single table of cents and transaction counts
+    per (sheet, month, merchant); every answer is a sum over a slice of it.
+    The Balance Summary figures written by calculating_balances are kept as
+    they are. The workbook is reloaded when its modification time changes.
+    """
+
+    def __init__(self, workbook_path=DEFAULT_WORKBOOK_PATH):
+        self.workbook_path = workbook_path
+        self.mtime = None
+        self.table = pd.DataFrame(columns=["sheet", "month", "merchant", "cents", "count"])
+        self.summary = {}
+
+    def refresh(self):
+        """Load the workbook if it changed since the last load. Returns False when it cannot be read."""
+        try:
+            mtime = os.path.getmtime(self.workbook_path)
+        except OSError:
+            return False
+        if mtime != self.mtime:
+            self.load()
+            self.mtime = mtime
+        return True
+
+    def load(self):
+        # The same reader calculating_balances uses, so dates and cents parse the same way here
+        ledger = read_ledger(self.workbook_path, CATEGORY_SHEETS)
+        if ledger is not None and not ledger.empty:
+            ledger = ledger.assign(
+                sheet=ledger["sheet"].astype(str),
+                month=ledger["date"].dt.to_period("M"),
+                merchant=ledger["description"].map(merchant_name),
+            )
+            self.table = ledger.groupby(["sheet", "month", "merchant"], observed=True)["cents"].agg(["sum", "count"]) \
+                .rename(columns={"sum": "cents"}).reset_index()
+
+        self.summary = {}
+        try:
+            summary = pd.read_excel(self.workbook_path, sheet_name=SUMMARY_SHEET, dtype=object)
+        except ValueError:  # No Balance Summary sheet until calculating_balances has run
+            summary = None
+        if summary is not None and summary.shape[1] >= 2:
+            for label, value in summary.iloc[:, :2].itertuples(index=False):
+                try:
+                    self.summary[str(label).strip().lower()] = float(value)
+                except (TypeError, ValueError):
+                    continue
+
+    def categories(self, question):
+        """Sheets named in the question and the question with those names removed.
+
+        All spending sheets are returned, flagged as not named, when the
+        question names none.
+        """
+        found = []
+        for sheet in sorted(CATEGORY_SHEETS, key=len, reverse=True):
+            # Longest names first, so "business expenses" does not also count as "expenses"
+            if sheet.lower() in question:
+                found.append(sheet)
+                question = question.replace(sheet.lower(), " ")
+        for word in re.findall(r'[a-z]+', question):
+            sheet = CATEGORY_ALIASES.get(word) or CATEGORY_ALIASES.get(word.rstrip('s'))
+            if sheet and sheet not in found:
+                found.append(sheet)
+        if found:
+            return sorted(found, key=CATEGORY_SHEETS.index), True, question
+        return [sheet for sheet in CATEGORY_SHEETS if sheet != INCOME_SHEET], False, question
+
+    def merchants(self, question, sheets):
+        """Merchants of the given sheets matching the words left over in the question.
+
+        Returns None when no such word remains, and an empty list when some
+        remain but none names a merchant of those sheets, meaning the question
+        is not one the table can answer.
+        """
+        words = [word for word in re.findall(r"[a-z][a-z&.']{2,}", question)
+                 if word not in STOPWORDS and word not in MONTHS and word.rstrip('s') not in CATEGORY_ALIASES]
+        if not words:
+            return None
+        known = self.table.loc[self.table["sheet"].isin(sheets), "merchant"].unique()
+        return [merchant for merchant in known if any(word.upper() in re.split(r"[^A-Z&']+", merchant) for word in words)]
+
+    def month_matches(self, question):
+        # "may" is also a verb; only treat it as a month when a year follows or it ends a phrase like "in may"
+        return [match for match in MONTH_PATTERN.finditer(question)
+                if match.group(1) != "may" or match.group(2) or re.search(r'\b(in|for|during|of|from|to|and|or|since|until|till|through) may\b', question)]
+
+    def unresolved_period(self, question):
+        """Whether the question names a period period() would misread as all time or as one month.
+
+        That is a relative period ("last month", "this year"), a week or
+        quarter, or a range or list of several months or years.
+        """
+        if RELATIVE_PERIOD_PATTERN.search(question):
+            return True
+        months = {MONTHS[match.group(1)] for match in self.month_matches(question)}
+        return len(months) > 1 or len(set(YEAR_PATTERN.findall(question))) > 1
+
+    def period(self, question):
+        """(months, label) for a month or year named in the question, or (None, "") for all time."""
+        months = self.table["month"]
+        matches = self.month_matches(question)
+        if matches:
+            match = matches[0]
+            month = MONTHS[match.group(1)]
+            if match.group(2):
+                year = int(match.group(2))
+            else:
+                # A bare month means its latest occurrence in the data
+                years = [period.year for period in months.unique() if period.month == month]
+                if not years:
+                    return [], calendar.month_name[month]
+                year = max(years)
+            target = pd.Period(year=year, month=month, freq="M")
+            return [target], f"{calendar.month_name[month]} {year}"
+        year = YEAR_PATTERN.search(question)
+        if year:
+            year = int(year.group(1))
+            return [period for period in months.unique() if period.year == year], str(year)
+        return None, ""
+
+    def select(self, sheets, months):
+        rows = self.table[self.table["sheet"].isin(sheets)]
+        if months is not None:
+            rows = rows[rows["month"].isin(months)]
+        return rows
+
+    def summary_answer(self, question):
+        for label, value in sorted(self.summary.items(), key=lambda item: len(item[0]), reverse=True):
+            if label in question:
+                return f"Your {label} is {format_dollars(round(value * 100))}, per the Balance Summary."
+        return None
+
+    def answer(self, question):
+        """Answer an aggregate question from the precomputed table, or None when it is not one."""
+        question = re.sub(r'\s+', ' ', question.lower()).strip()
+        if not AGGREGATE_WORDS.search(question) and not COUNT_PATTERN.search(question):
+            return None
+        if self.unresolved_period(question) or not self.refresh() or self.table.empty:
+            return None
+
+        summary = self.summary_answer(question)
+        if summary and not MONTH_PATTERN.search(question) and not YEAR_PATTERN.search(question):
+            return summary
+
+        sheets, named, rest = self.categories(question)
+        months, label = self.period(question)
+        scope = ", ".join(sheets) if named else "spending"
+        when = f" in {label}" if label else ""
+        rows = self.select(sheets, months)
+        merchants = self.merchants(YEAR_PATTERN.sub(" ", rest), sheets)
+        if merchants is not None:
+            if not merchants:
+                # Asks about something that is neither a category nor a known merchant; leave it to the LLM
+                return None
+            rows = rows[rows["merchant"].isin(merchants)]
+            scope = " and ".join(merchants[:3]) + (" and others" if len(merchants) > 3 else "")
+
+        if TOP_PATTERN.search(question):
+            limit = re.search(r'\btop (\d+)\b', question)
+            limit = int(limit.group(1)) if limit else 5
+            top = rows.groupby("merchant")["cents"].sum().nlargest(limit)
+            if top.empty:
+                return f"No {scope} transactions found{when}."
+            lines = [f"{rank}. {merchant}: {format_dollars(cents)}" for rank, (merchant, cents) in enumerate(top.items(), 1)]
+            return f"Top {len(lines)} merchants by {scope}{when}:\n" + "\n".join(lines)
+
+        if BY_CATEGORY_PATTERN.search(question):
+            totals = self.select(CATEGORY_SHEETS, months).groupby("sheet")["cents"].sum()
+            if totals.empty:
+                return f"No transactions found{when}."
+            lines = [f"{sheet}: {format_dollars(totals[sheet])}" for sheet in CATEGORY_SHEETS if sheet in totals.index]
+            return f"Totals by category{when}:\n" + "\n".join(lines)
+
+        if BY_MONTH_PATTERN.search(question):
+            totals = rows.groupby("month")["cents"].sum().sort_index()
+            if totals.empty:
+                return f"No {scope} transactions found{when}."
+            lines = [f"{month.strftime('%B %Y')}: {format_dollars(cents)}" for month, cents in totals.items()]
+            return f"{scope.capitalize() if not named else scope} by month{when}:\n" + "\n".join(lines)
+
+        if COUNT_PATTERN.search(question):
+            return f"{int(rows['count'].sum())} {scope} transactions{when}."
+
+        if TOTAL_PATTERN.search(question):
+            # Worded by the sheets the rows come from, not by the verb of the question
+            kinds = set(rows["sheet"]) or set(sheets)
+            parts = []
+            if INCOME_SHEET in kinds:
+                income = rows[rows["sheet"] == INCOME_SHEET]
+                source = f" from {scope}" if merchants else " in income"
+                parts.append(f"received {format_dollars(int(income['cents'].sum()))}{source}{when}, across {int(income['count'].sum())} transactions")
+            if kinds - {INCOME_SHEET}:
+                spending = rows[rows["sheet"] != INCOME_SHEET]
+                spending_scope = scope if merchants else ", ".join(sheet for sheet in sheets if sheet != INCOME_SHEET)
+                target = f" on {spending_scope}" if merchants or named else ""
+                parts.append(f"spent {format_dollars(int(spending['cents'].sum()))}{target}{when}, across {int(spending['count'].sum())} transactions")
+            return "You " + ", and ".join(parts) + "."
+
+        return summary
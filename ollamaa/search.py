@@ -1,21 +1,76 @@
-import chromadb
 import ollama
 import pandas as pd
-import json
+import math
 import os
+import time
+try:
+    from .embedding_batch import DEFAULT_BATCH_SIZE, DEFAULT_CONCURRENCY, chunk_id, remove_untagged, sync_collection
+    from .vector_store import open_client
+except ImportError:  # Run as a script from inside ollamaa
+    from embedding_batch import DEFAULT_BATCH_SIZE, DEFAULT_CONCURRENCY, chunk_id, remove_untagged, sync_collection
+    from vector_store import open_client
 
-# Function to initialize ChromaDB connection
+# Function to initialize ChromaDB connection; the backend (HTTP server, embedded Chroma or numpy) comes from config.ini
 def initialize_chromadb():
     try:
-        chroma = chromadb.HttpClient(host="localhost", port=8000)
+        chroma = open_client()
         print("ChromaDB connection initialized successfully.")
         return chroma
     except Exception as e:
         print(f"Failed to initialize ChromaDB connection: {e}")
         return None
 
+# Metadata tag of the documents this script owns in the shared collection
+ORIGIN = "categorized_data"
+
+CATEGORY_COLUMNS = ("Date", "Amount", "Description", "Source")
+
+def _present(value):
+    return value is not None and not (isinstance(value, float) and math.isnan(value)) and str(value).strip() != ""
+
+def transaction_document(category, row):
+    """Text and metadata of one categorized transaction."""
+    date, amount, description, source = (row.get(column) for column in CATEGORY_COLUMNS)
+    parts = [f"{date}" if _present(date) else "Undated", f"{category} transaction"]
+    if _present(description):
+        parts.append(str(description).strip())
+    if _present(source):
+        parts.append(f"source {source}")
+    if _present(amount):
+        parts.append(f"amount {amount}")
+    metadata = {"origin": ORIGIN, "sheet": category, "category": category}
+    if _present(date):
+        metadata["date"] = str(date)
+    if _present(source):
+        metadata["source"] = str(source)
+    try:
+        metadata["amount"] = float(amount)
+    except (TypeError, ValueError):
+        pass
+    return ", ".join(parts), metadata
+
+def report_document(sheet_name, row):
+    """Text and metadata of one row of a report sheet such as Weekly Budget or Balance Summary."""
+    text = f"{sheet_name}: " + ", ".join(f"{column} {value}" for column, value in row.items() if _present(value))
+    return text, {"origin": ORIGIN, "sheet": sheet_name}
+
+def build_sheet_records(sheet_name, df):
+    """Map content-hash IDs to (document, metadata) for every row of a sheet."""
+    is_category_sheet = all(column in df.columns for column in CATEGORY_COLUMNS)
+    records = {}
+    occurrences = {}
+    for row in df.to_dict(orient='records'):
+        if not any(_present(value) for value in row.values()):
+            continue
+        document, metadata = transaction_document(sheet_name, row) if is_category_sheet else report_document(sheet_name, row)
+        # Identical transactions (same day, amount and text) are kept apart by their occurrence number
+        occurrence = occurrences.get(document, 0)
+        occurrences[document] = occurrence + 1
+        records[chunk_id(f"{sheet_name}#{occurrence}", document)] = (document, metadata)
+    return records
+
 # Function to store Excel data and embeddings in ChromaDB
-def store_excel_data_in_chroma(excel_file_path, collection_name, embedmodel='nomic-embed-text'):
+def store_excel_data_in_chroma(excel_file_path, collection_name, embedmodel='nomic-embed-text', batch_size=DEFAULT_BATCH_SIZE, concurrency=DEFAULT_CONCURRENCY):
     try:
         excel_data = pd.read_excel(excel_file_path, sheet_name=None)
         print("Excel file loaded successfully.")
@@ -37,33 +92,28 @@ def store_excel_data_in_chroma(excel_file_path, collection_name, embedmodel='nom
         print(f"Failed to access or create collection '{collection_name}': {e}")
         return
 
+    # One document per transaction (and per report row), embedded from its own text
+    records = {}
     for sheet_name, df in excel_data.items():
         try:
             print(f"Processing sheet: {sheet_name}")
-            # Convert each DataFrame to a list of dictionaries
-            sheet_data = df.to_dict(orient='records')
-            sheet_data_json = json.dumps(sheet_data)
-
-            # Use Ollama to generate embeddings for the sheet data
-            response = ollama.embeddings(model=embedmodel, prompt=f"Excel data: {sheet_name}")
-            embeddings = response["embedding"]
-
-            # Generate unique ID for the document
-            doc_id = f'excel_data_{sheet_name}'
-            print(f"Generated document ID: {doc_id}")
-
-            # Store serialized data in ChromaDB
-            collection.add(
-                ids=[doc_id],
-                documents=[sheet_data_json],
-                embeddings=[embeddings], 
-            )
-            print(f"Data for sheet '{sheet_name}' stored successfully with embeddings.")
-        except KeyError as e:
-            print(f"Missing data or invalid format in sheet '{sheet_name}': {e}")
+            records.update(build_sheet_records(sheet_name, df))
         except Exception as e:
             print(f"Error processing sheet '{sheet_name}': {e}")
 
+    # Only rows not already in the collection are embedded; rows gone from the workbook are deleted
+    starttime = time.time()
+    try:
+        # Whole-sheet JSON documents from before rows were tagged would otherwise stay nearest neighbours
+        legacy = remove_untagged(collection)
+        if legacy:
+            print(f"Deleted {legacy} untagged documents left by an earlier version.")
+        added, deleted, unchanged = sync_collection(collection, records, embedmodel, batch_size, concurrency, where={"origin": ORIGIN})
+        print(f"Stored {added} new rows, deleted {deleted} removed rows, kept {unchanged} unchanged rows.")
+    except Exception as e:
+        print(f"Error storing rows in ChromaDB: {e}")
+    print("--- %s seconds ---" % (time.time() - starttime))
+
 # Main function
 def main():
     file_path = "ollamaa\categorized_data.xlsx"
@@ -0,0 +1,246 @@
+import configparser
+import json
+import os
+import numpy as np
+try:
+    import chromadb
+except ImportError:  # Only the numpy backend works without it
+    chromadb = None
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config.ini")
+
+# "http" talks to a separately started `chroma run` server, "persistent" runs Chroma
+# in-process on a local folder, and "numpy" keeps a memory-mapped matrix in that folder
+BACKENDS = ("http", "persistent", "numpy")
+DEFAULT_BACKEND = "http"
+DEFAULT_HOST = "localhost"
+DEFAULT_PORT = 8000
+DEFAULT_PATH = "vectorstore"
+
+def load_settings(config_path=CONFIG_PATH):
+    """The vector store settings from the [main] section of config.ini, with defaults for missing keys."""
+    config = configparser.ConfigParser()
+    config.read(config_path)
+    main = dict(config.items("main")) if config.has_section("main") else {}
+    path = main.get("vectorpath", DEFAULT_PATH)
+    if not os.path.isabs(path):
+        path = os.path.join(os.path.dirname(os.path.abspath(config_path)), path)
+    return {
+        "backend": main.get("vectorstore", DEFAULT_BACKEND).strip().lower(),
+        "host": main.get("chromahost", DEFAULT_HOST),
+        "port": int(main.get("chromaport", DEFAULT_PORT)),
+        "path": path,
+    }
+
+def open_client(settings=None):
+    """A client for the configured backend; every backend has Chroma's get_or_create_collection/get_collection API."""
+    settings = settings or load_settings()
+    backend = settings["backend"]
+    if backend == "numpy":
+        return NumpyClient(settings["path"])
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown vectorstore '{backend}' in config.ini. Use one of: {', '.join(BACKENDS)}.")
+    if chromadb is None:
+        raise ImportError(f"The '{backend}' vectorstore needs chromadb; install it or set vectorstore=numpy in config.ini.")
+    if backend == "persistent":
+        return chromadb.PersistentClient(path=settings["path"])
+    return chromadb.HttpClient(host=settings["host"], port=settings["port"])
+
+def _matches(metadata, where):
+    # Equality filters only, which is all the scripts here use
+    return not where or all(metadata.get(key) == value for key, value in where.items())
+
+class NumpyCollection:
+    """One collection stored as unit-length float32 rows in embeddings.npy plus a records.json of ids, documents and metadata.
+
+    The matrix is memory-mapped when opened and queried with an exact cosine
+    search, one matrix-vector product per question. Writes are buffered in
+    memory: upserted rows are appended and replaced or deleted rows are only
+    marked dead, so a batch never copies the matrix. flush() (called by
+    sync_collection, or on leaving a with block) compacts the collection
+    and rewrites both files atomically, once per sync. A collection with no
+    unflushed writes is read again once another process has rewritten it.
+    """
+
+    def __init__(self, name, path):
+        self.name = name
+        self.path = path
+        self.embeddings_path = os.path.join(path, "embeddings.npy")
+        self.records_path = os.path.join(path, "records.json")
+        self._load()
+
+    def _load(self):
+        self.ids, self.documents, self.metadatas = [], [], []
+        self.embeddings = np.zeros((0, 0), dtype=np.float32)
+        self.loaded_mtime = None
+        if os.path.exists(self.records_path):
+            self.loaded_mtime = os.stat(self.records_path).st_mtime_ns
+            with open(self.records_path, "r", encoding="utf-8") as f:
+                records = json.load(f)
+            self.ids, self.documents, self.metadatas = records["ids"], records["documents"], records["metadatas"]
+            self.embeddings = np.load(self.embeddings_path, mmap_mode="r")
+        self.positions = {record_id: position for position, record_id in enumerate(self.ids)}
+        self.pending = []  # Matrices of upserted rows not yet joined to self.embeddings
+        self.dead = set()  # Positions of replaced or deleted rows, dropped on flush()
+        self.dirty = False
+
+    def _reload_if_changed(self):
+        # Another process (search.py, import.py) may have synced the collection since it was read
+        if self.dirty:
+            return
+        try:
+            mtime = os.stat(self.records_path).st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime != self.loaded_mtime:
+            self._load()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
+
+    def count(self):
+        self._reload_if_changed()
+        return len(self.positions)
+
+    def _matrix(self):
+        # Join the rows upserted since the last call onto the matrix, in one copy
+        if self.pending:
+            parts = ([self.embeddings] if len(self.embeddings) else []) + self.pending
+            self.embeddings = np.vstack(parts)
+            self.pending = []
+        return self.embeddings
+
+    def flush(self):
+        """Drop dead rows and write the collection to disk, if anything changed since the last flush."""
+        if not self.dirty:
+            return
+        matrix = self._matrix()
+        if self.dead:
+            keep = [position for position in range(len(self.ids)) if position not in self.dead]
+            matrix = matrix[keep] if keep else np.zeros((0, matrix.shape[1] if matrix.ndim == 2 else 0), dtype=np.float32)
+            self.ids = [self.ids[position] for position in keep]
+            self.documents = [self.documents[position] for position in keep]
+            self.metadatas = [self.metadatas[position] for position in keep]
+            self.positions = {record_id: position for position, record_id in enumerate(self.ids)}
+            self.dead = set()
+
+        os.makedirs(self.path, exist_ok=True)
+        temp_path = self.embeddings_path + ".tmp.npy"
+        np.save(temp_path, np.ascontiguousarray(matrix, dtype=np.float32))
+        os.replace(temp_path, self.embeddings_path)
+        temp_path = self.records_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({"ids": self.ids, "documents": self.documents, "metadatas": self.metadatas}, f)
+        os.replace(temp_path, self.records_path)
+        self.embeddings = np.load(self.embeddings_path, mmap_mode="r")
+        self.loaded_mtime = os.stat(self.records_path).st_mtime_ns
+        self.dirty = False
+
+    def upsert(self, ids, embeddings, documents=None, metadatas=None):
+        if not len(ids):
+            return
+        vectors = np.asarray(embeddings, dtype=np.float32).reshape(len(ids), -1)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        self.pending.append(vectors / np.where(norms == 0, 1, norms))
+        for index, record_id in enumerate(ids):
+            # A replaced record is appended again and its old row left for flush() to drop
+            if record_id in self.positions:
+                self.dead.add(self.positions[record_id])
+            self.positions[record_id] = len(self.ids)
+            self.ids.append(record_id)
+            self.documents.append(documents[index] if documents else None)
+            self.metadatas.append(metadatas[index] if metadatas else None)
+        self.dirty = True
+
+    add = upsert
+
+    def delete(self, ids=None, where=None):
+        removed = set(ids or [])
+        if where:
+            removed.update(self.ids[position] for position in self._selected(where))
+        for record_id in removed:
+            position = self.positions.pop(record_id, None)
+            if position is not None:
+                self.dead.add(position)
+                self.dirty = True
+
+    def _selected(self, where=None):
+        return [position for position in range(len(self.ids))
+                if position not in self.dead and _matches(self.metadatas[position] or {}, where)]
+
+    def get(self, ids=None, where=None, include=("documents", "metadatas"), limit=None, offset=0):
+        if ids is not None:
+            positions = [self.positions[record_id] for record_id in ids if record_id in self.positions]
+        else:
+            positions = self._selected(where)
+        positions = positions[offset:offset + limit if limit is not None else None]
+        result = {"ids": [self.ids[position] for position in positions]}
+        if "documents" in include:
+            result["documents"] = [self.documents[position] for position in positions]
+        if "metadatas" in include:
+            result["metadatas"] = [self.metadatas[position] for position in positions]
+        if "embeddings" in include:
+            matrix = self._matrix()
+            result["embeddings"] = [matrix[position].tolist() for position in positions]
+        return result
+
+    def query(self, query_embeddings, n_results=10, where=None, include=("documents", "metadatas", "distances")):
+        """Nearest records by cosine distance, in Chroma's one-list-per-query result shape."""
+        result = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        self._reload_if_changed()
+        matrix = self._matrix()
+        whole = not where and not self.dead
+        candidates = np.arange(len(self.ids)) if whole else np.array(self._selected(where), dtype=np.int64)
+        for query in query_embeddings:
+            query = np.asarray(query, dtype=np.float32)
+            query = query / (np.linalg.norm(query) or 1)
+            if len(candidates) == 0:
+                positions, distances = [], []
+            else:
+                similarities = matrix @ query if whole else matrix[candidates] @ query
+                count = min(n_results, len(candidates))
+                # Partial sort: only the top count similarities are ordered
+                best = np.argpartition(-similarities, count - 1)[:count]
+                best = best[np.argsort(-similarities[best])]
+                positions = candidates[best].tolist()
+                distances = (1 - similarities[best]).tolist()
+            result["ids"].append([self.ids[position] for position in positions])
+            result["documents"].append([self.documents[position] for position in positions])
+            result["metadatas"].append([self.metadatas[position] for position in positions])
+            result["distances"].append(distances)
+        return result
+
+class NumpyClient:
+    """Chroma-style client over a folder holding one NumpyCollection per sub-folder."""
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self.collections = {}
+
+    def list_collections(self):
+        if not os.path.isdir(self.path):
+            return []
+        return sorted(name for name in os.listdir(self.path) if os.path.isdir(os.path.join(self.path, name)))
+
+    def get_or_create_collection(self, name, metadata=None):
+        # Always cosine, so the hnsw:space metadata Chroma takes is accepted and ignored
+        if name not in self.collections:
+            self.collections[name] = NumpyCollection(name, os.path.join(self.path, name))
+        return self.collections[name]
+
+    def get_collection(self, name):
+        if name not in self.collections and name not in self.list_collections():
+            raise ValueError(f"Collection {name} does not exist.")
+        return self.get_or_create_collection(name)
+
+    def delete_collection(self, name):
+        collection_path = os.path.join(self.path, name)
+        self.collections.pop(name, None)
+        for file_name in ("embeddings.npy", "records.json"):
+            if os.path.exists(os.path.join(collection_path, file_name)):
+                os.remove(os.path.join(collection_path, file_name))
+        if os.path.isdir(collection_path):
+            os.rmdir(collection_path)
@@ -1,146 +1,180 @@
 import pdfplumber
-import openpyxl
 import os
 import logging
 import re
+from concurrent.futures import ProcessPoolExecutor
+from date_parser import ColumnDateParser
+from ingest_manifest import IngestManifest, default_manifest_path
+from transaction_store import RAW, StoreSink, TransactionStore
 
 # Setup basic configuration for logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-def extract_data_from_paypal(pdf_path):
-    data = []
-    try:
-        with pdfplumber.open(pdf_path) as pdf:
-            for page_number, page in enumerate(pdf.pages, start=1):
-                text = page.extract_text()
-                logging.info("Extracted text from page %d of PayPal PDF: %s", page_number, text)
-                
-                if not text:
-                    logging.warning("No text found on page %d of %s", page_number, pdf_path)
-                    continue
+# Large PDFs are split into tasks of this many pages so one statement can use several workers
+PAGES_PER_TASK = 10
 
-                # Check if "Transaction History - USD" section is present
-                if "Transaction History - USD" in text:
-                    transaction_text = text.split("Transaction History - USD")[1]
-                    logging.info("Transaction text extracted: %s", transaction_text)
-
-                    # Extract transactions
-                    transactions = re.findall(r'(\d{2}/\d{2}/\d{2,4})\s+(.+?)\s+([-.\d,]+)\s+([-.\d,]+)\s+([-.\d,]+)', transaction_text)
-                    for transaction in transactions:
-                        date, description, gross, fee, net = transaction
-                        description = description.split('ID:')[0].strip()  # Clean up description
-                        data.append((date, description, net, "PayPal"))
-                else:
-                    # Preserve the previous data extraction logic for PayPal PDF
-                    lines = text.split("\n")
-                    for line in lines:
-                        if re.match(r'\d{2}/\d{2}/\d{4}', line):
-                            parts = line.split()
-                            date = parts[0]
-                            description = " ".join(parts[1:-2])
-                            total = parts[-1]
-                            data.append((date, description, total, "PayPal"))
+def parse_paypal_page(text, date_parser):
+    data = []
+    # Check if "Transaction History - USD" section is present
+    if "Transaction History - USD" in text:
+        transaction_text = text.split("Transaction History - USD")[1]
+        logging.info("Transaction text extracted: %s", transaction_text)
+
+        # Extract transactions
+        transactions = re.findall(r'(\d{2}/\d{2}/\d{2,4})\s+(.+?)\s+([-.\d,]+)\s+([-.\d,]+)\s+([-.\d,]+)', transaction_text)
+        for transaction in transactions:
+            date, description, gross, fee, net = transaction
+            description = description.split('ID:')[0].strip()  # Clean up description
+            data.append((date_parser.normalize(date), description, net, "PayPal"))
+    else:
+        # Preserve the previous data extraction logic for PayPal PDF
+        lines = text.split("\n")
+        for line in lines:
+            if re.match(r'\d{2}/\d{2}/\d{4}', line):
+                parts = line.split()
+                date = parts[0]
+                description = " ".join(parts[1:-2])
+                total = parts[-1]
+                data.append((date_parser.normalize(date), description, total, "PayPal"))
+    return data
 
-    except Exception as e:
-        logging.error("Failed to process PDF %s: %s", pdf_path, str(e))
+def parse_ebay_page(text, date_parser):
+    data = []
+    orders = text.split("Order date:")
+    for order_text in orders[1:]:  # Skip first element as it's not an order
+        order_lines = order_text.split("\n")
+        date = order_lines[0].split("•")[0].strip()
+        total_line = next((line for line in order_lines if "Order total:" in line), "")
+        total = total_line.split("Order total:")[1].replace("US $", "").strip().split("•")[0] if total_line else ""
+        description = " ".join(order_lines[2:]).strip()
+        data.append((date_parser.normalize(date), description, f"${total}", "eBay"))
     return data
 
-def extract_data_from_ebay(pdf_path):
-    data = set()  # Using a set to store unique data
+PAGE_PARSERS = {
+    "PayPal": parse_paypal_page,
+    "eBay": parse_ebay_page,
+}
+
+def extract_pages(task):
+    """Extract rows from a page range of one PDF. Runs inside a worker process."""
+    pdf_path, kind, first_page, last_page = task
+    data = []
+    date_parser = ColumnDateParser()
     try:
         with pdfplumber.open(pdf_path) as pdf:
-            for page_number, page in enumerate(pdf.pages, start=1):
-                text = page.extract_text()
-                # logging.info("Extracted text from page %d of eBay PDF: %s", page_number, text)
-                
+            for page_number in range(first_page, last_page + 1):
+                text = pdf.pages[page_number - 1].extract_text()
+                if kind == "PayPal":
+                    logging.info("Extracted text from page %d of PayPal PDF: %s", page_number, text)
+
                 if not text:
                     logging.warning("No text found on page %d of %s", page_number, pdf_path)
                     continue
 
-                orders = text.split("Order date:")
-                for order_text in orders[1:]:  # Skip first element as it's not an order
-                    order_lines = order_text.split("\n")
-                    date = order_lines[0].split("•")[0].strip()
-                    total_line = next((line for line in order_lines if "Order total:" in line), "")
-                    total = total_line.split("Order total:")[1].replace("US $", "").strip().split("•")[0] if total_line else ""
-                    description = " ".join(order_lines[2:]).strip()
-                    data.add((date, description, f"${total}", "eBay"))  # Adding data to the set
+                data.extend(PAGE_PARSERS[kind](text, date_parser))
     except Exception as e:
         logging.error("Failed to process PDF %s: %s", pdf_path, str(e))
-    return list(data)  # Converting set back to list before returning
-
-def save_to_excel(data, file_name, sheet_name):
-    try:
-        if os.path.exists(file_name):
-            wb = openpyxl.load_workbook(file_name)
-        else:
-            wb = openpyxl.Workbook()
-            wb.remove(wb.active)  # Remove the default sheet
-
-        if sheet_name not in wb.sheetnames:
-            ws = wb.create_sheet(title=sheet_name)
-            ws.append(("Date", "Description", "Amount", "Category"))  # Only add headers if sheet is newly created
-        else:
-            ws = wb[sheet_name]
-
-        for row in data:
-            ws.append(row)
+    return data
 
-        # Remove duplicate rows
-        remove_duplicate_rows(ws)
+def count_pages(pdf_path):
+    with pdfplumber.open(pdf_path) as pdf:
+        return len(pdf.pages)
 
-        wb.save(file_name)
-        logging.info("Data written to %s in %s", sheet_name, file_name)
-    except Exception as e:
-        logging.error("Failed to save data to Excel %s: %s", file_name, str(e))
-
-def remove_duplicate_rows(sheet):
-    # Convert rows to tuples for comparison
-    rows = [tuple(cell.value for cell in row) for row in sheet.iter_rows(min_row=2, max_row=sheet.max_row, max_col=sheet.max_column)]
-    unique_rows = set(rows)
-    
-    # Clear existing data
-    sheet.delete_rows(2, sheet.max_row)
-    
-    # Write unique rows back to the sheet
-    for row in unique_rows:
-        sheet.append(row)
-
-def identify_and_process_pdfs(directory, output_excel):
-    pdf_files = [f for f in os.listdir(directory) if f.endswith('.pdf') and not f.endswith('-read.pdf')]
-    logging.info("Found %d PDF files in the directory.", len(pdf_files))
-    
+def plan_pdf_tasks(directory, pdf_files, pages_per_task=PAGES_PER_TASK):
+    """Split every PDF into page-range tasks, in file order."""
+    plan = []
     for filename in pdf_files:
         pdf_path = os.path.join(directory, filename)
         logging.info("Processing PDF: %s", pdf_path)
-        
+
         if "ebay" in filename.lower():
             logging.info("Processing eBay PDF: %s", filename)
-            data = extract_data_from_ebay(pdf_path)
-            save_to_excel(data, output_excel, "eBay")
+            kind = "eBay"
         elif filename.endswith("PDF"):
             logging.info("Skipping PDF: %s", filename)
+            plan.append((filename, None, []))
+            continue
         else:
             logging.info("Processing PayPal PDF: %s", filename)
-            data = extract_data_from_paypal(pdf_path)
+            kind = "PayPal"
+
+        try:
+            page_count = count_pages(pdf_path)
+        except Exception as e:
+            logging.error("Failed to process PDF %s: %s", pdf_path, str(e))
+            plan.append((filename, kind, []))
+            continue
+
+        tasks = [
+            (pdf_path, kind, first_page, min(first_page + pages_per_task - 1, page_count))
+            for first_page in range(1, page_count + 1, pages_per_task)
+        ]
+        plan.append((filename, kind, tasks))
+    return plan
+
+def identify_and_process_pdfs(directory, store=None, workers=1, pages_per_task=PAGES_PER_TASK, manifest=None):
+    store = store or TransactionStore()
+    manifest = manifest or IngestManifest("pdfextractor", default_manifest_path("pdfextractor", os.path.dirname(store.root)))
+    if not store.exists(RAW):
+        manifest.forget()
+
+    # Unchanged statements were ingested by an earlier run; skip them without opening them
+    pdf_files = sorted(
+        f for f in os.listdir(directory)
+        if f.endswith('.pdf') and not manifest.is_current(os.path.join(directory, f))
+    )
+    logging.info("Found %d new or changed PDF files in the directory.", len(pdf_files))
+
+    plan = plan_pdf_tasks(directory, pdf_files, pages_per_task)
+    tasks = [task for _, _, file_tasks in plan for task in file_tasks]
+
+    # map() returns results in task order, so rows come back in file and page order
+    if workers > 1 and len(tasks) > 1:
+        logging.info("Extracting %d page ranges with %d workers", len(tasks), workers)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = iter(list(executor.map(extract_pages, tasks)))
+    else:
+        results = map(extract_pages, tasks)
+
+    outputs_by_file = {}
+    for filename, kind, file_tasks in plan:
+        data = [row for _ in file_tasks for row in next(results)]
+        outputs = {}
+        if kind == "eBay":
+            # Orders can repeat across pages; keep the first occurrence of each
+            outputs["eBay"] = list(dict.fromkeys(data))
+        elif kind == "PayPal":
             if not data:
                 logging.warning("No data extracted from PayPal PDF: %s", filename)
             else:
-                save_to_excel(data, output_excel, "PayPal")
-        
-        # Rename the processed file
-        new_filename = f"{os.path.splitext(filename)[0]}-read.pdf"
-        new_pdf_path = os.path.join(directory, new_filename)
-        os.rename(pdf_path, new_pdf_path)
-        logging.info("Renamed processed file to: %s", new_pdf_path)
-
-def main():
-    directory_path = "client_docs"
-    output_excel = "processed_files/pdf_output_data.xlsx"
+                outputs["PayPal"] = data
+        outputs_by_file[filename] = outputs
+
+    # Merge everything into the raw store once, after all extraction has finished.
+    # A changed statement first takes back the rows its previous version produced.
+    try:
+        with StoreSink(store, RAW) as sink:
+            for filename, outputs in outputs_by_file.items():
+                previous = manifest.outputs(os.path.join(directory, filename)) or {}
+                for sheet_name, data in previous.items():
+                    sink.remove(sheet_name, data)
+                for sheet_name, data in outputs.items():
+                    sink.add(sheet_name, data)
+    except Exception as e:
+        # Raised so run_all does not count the stage as done
+        logging.error("Failed to save data to %s: %s", store.root, str(e))
+        raise
+
+    for filename, outputs in outputs_by_file.items():
+        manifest.record(os.path.join(directory, filename), outputs)
+    manifest.save()
+
+def main(directory_path="client_docs", store=None, workers=None):
+    workers = workers or int(os.getenv("PDF_WORKERS", os.cpu_count() or 1))
     if not os.path.exists(directory_path):
         logging.warning("Directory %s does not exist. Please check the path.", directory_path)
         return
-    identify_and_process_pdfs(directory_path, output_excel)
+    identify_and_process_pdfs(directory_path, store or TransactionStore(), workers)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,169 @@
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+DEFAULT_STATE_PATH = os.path.join("processed_files", "pipeline_state.json")
+
+def fingerprint(paths):
+    """Hash the path, size and mtime of every file under paths; missing paths hash as missing."""
+    digest = hashlib.sha256()
+    for path in sorted(paths):
+        if os.path.isdir(path):
+            files = sorted(
+                os.path.join(directory, filename)
+                for directory, _, filenames in os.walk(path)
+                for filename in filenames
+            )
+        else:
+            files = [path]
+        for file_path in files:
+            try:
+                stat = os.stat(file_path)
+            except FileNotFoundError:
+                digest.update(f"{file_path}:missing\n".encode())
+                continue
+            digest.update(f"{file_path}:{stat.st_size}:{stat.st_mtime_ns}\n".encode())
+    return digest.hexdigest()
+
+def _overlaps(first, second):
+    first, second = os.path.normpath(first), os.path.normpath(second)
+    return first == second or first.startswith(second + os.sep) or second.startswith(first + os.sep)
+
+class Stage:
+    """One step of the pipeline: a module-level callable and the paths it reads and writes.
+
+    A stage depends on every other stage whose outputs overlap its inputs.
+    Interactive stages read from the terminal, so they run in the main process
+    once nothing else is running.
+    """
+
+    def __init__(self, name, func, inputs=(), outputs=(), interactive=False):
+        self.name = name
+        self.func = func
+        self.inputs = tuple(inputs)
+        self.outputs = tuple(outputs)
+        self.interactive = interactive
+
+def _timed(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+class Pipeline:
+    """Run stages as soon as the stages they depend on have finished, several at a time.
+
+    Independent stages run concurrently in separate processes. A stage fails
+    when its function raises; stage functions raise instead of printing their
+    errors, since returning means success. A stage is skipped when the
+    fingerprint of its inputs matches the one recorded after its last
+    successful run and all of its outputs exist; a failure clears that record.
+    Stages downstream of a failure are not run.
+    """
+
+    def __init__(self, stages, state_path=DEFAULT_STATE_PATH):
+        self.stages = list(stages)
+        self.state_path = state_path
+        self.state = {}
+        if os.path.exists(state_path):
+            with open(state_path) as state_file:
+                self.state = json.load(state_file)
+        self.dependencies = {
+            stage.name: {
+                other.name
+                for other in self.stages
+                if other is not stage and any(_overlaps(path, output) for path in stage.inputs for output in other.outputs)
+            }
+            for stage in self.stages
+        }
+
+    def _is_current(self, stage, inputs_fingerprint):
+        return (
+            self.state.get(stage.name) == inputs_fingerprint
+            and all(os.path.exists(output) for output in stage.outputs)
+        )
+
+    def _save_state(self):
+        os.makedirs(os.path.dirname(self.state_path) or ".", exist_ok=True)
+        with open(self.state_path, "w") as state_file:
+            json.dump(self.state, state_file, indent=2)
+
+    def run(self, workers=None, force=False):
+        """Run the pipeline and return {stage name: (status, seconds)}."""
+        results = {}
+        pending = list(self.stages)
+        running = {}
+        start = time.perf_counter()
+
+        with ProcessPoolExecutor(max_workers=workers or len(self.stages)) as executor:
+            while pending or running:
+                progressed = False
+                for stage in list(pending):
+                    dependencies = self.dependencies[stage.name]
+                    if any(results.get(name, ("",))[0] in ("failed", "blocked") for name in dependencies):
+                        pending.remove(stage)
+                        progressed = True
+                        results[stage.name] = ("blocked", 0.0)
+                        print(f"[pipeline] {stage.name}: not run, a stage it depends on failed")
+                        continue
+                    if not all(name in results for name in dependencies):
+                        continue
+                    if stage.interactive and running:
+                        continue  # Wait for the terminal to be free
+
+                    pending.remove(stage)
+                    progressed = True
+                    inputs_fingerprint = fingerprint(stage.inputs)
+                    if not force and self._is_current(stage, inputs_fingerprint):
+                        results[stage.name] = ("skipped", 0.0)
+                        print(f"[pipeline] {stage.name}: inputs unchanged, skipped")
+                        continue
+
+                    print(f"[pipeline] {stage.name}: started")
+                    if stage.interactive:
+                        try:
+                            elapsed = _timed(stage.func)
+                        except Exception as e:
+                            self._fail(stage, e, results)
+                        else:
+                            self._finish(stage, inputs_fingerprint, elapsed, results)
+                        continue
+                    running[executor.submit(_timed, stage.func)] = (stage, inputs_fingerprint)
+
+                if not running:
+                    if not progressed:
+                        raise ValueError(f"Stages {[stage.name for stage in pending]} depend on each other")
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage, inputs_fingerprint = running.pop(future)
+                    try:
+                        elapsed = future.result()
+                    except Exception as e:
+                        self._fail(stage, e, results)
+                    else:
+                        self._finish(stage, inputs_fingerprint, elapsed, results)
+
+        self.report(results, time.perf_counter() - start)
+        return results
+
+    def _finish(self, stage, inputs_fingerprint, elapsed, results):
+        results[stage.name] = ("done", elapsed)
+        print(f"[pipeline] {stage.name}: done in {elapsed:.2f}s")
+        self.state[stage.name] = inputs_fingerprint
+        self._save_state()
+
+    def _fail(self, stage, error, results):
+        results[stage.name] = ("failed", 0.0)
+        print(f"[pipeline] {stage.name}: failed: {error}")
+        # The outputs may be half written; the next run must not skip the stage
+        if self.state.pop(stage.name, None) is not None:
+            self._save_state()
+
+    def report(self, results, total):
+        print("\nStage                 Status      Wall time")
+        for stage in self.stages:
+            status, elapsed = results.get(stage.name, ("not run", 0.0))
+            print(f"{stage.name:<21} {status:<11} {elapsed:8.2f}s")
+        print(f"{'total':<21} {'':<11} {total:8.2f}s")
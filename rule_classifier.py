@@ -0,0 +1,58 @@
+import json
+import os
+import re
+
+DEFAULT_RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "classification_rules.json")
+
+def load_rules(path=DEFAULT_RULES_PATH):
+    # Each rule is {"keywords": [...], "category": ..., "source": ...}; earlier rules win
+    if not os.path.exists(path):
+        print(f"Classification rules not found at {path}; every row will go to the model.")
+        return []
+    with open(path) as rules_file:
+        return json.load(rules_file)
+
+class RuleClassifier:
+    """Classify descriptions locally with one compiled regex over all keyword rules.
+
+    Every rule becomes a named group of a single alternation, so a description is
+    scanned once no matter how many rules there are. When several rules match,
+    the one listed first wins. Rows no rule matches are left for the model.
+    """
+
+    def __init__(self, rules=None):
+        self.rules = load_rules() if rules is None else rules
+        groups = [
+            f"(?P<r{index}>{'|'.join(re.escape(keyword.lower()) for keyword in rule['keywords'])})"
+            for index, rule in enumerate(self.rules)
+            if rule.get("keywords")
+        ]
+        self.pattern = re.compile("|".join(groups)) if groups else None
+        self.matched = 0
+        self.total = 0
+        self.rule_hits = [0] * len(self.rules)
+
+    def classify(self, description):
+        """Return (category, source) for a confident rule match, or None."""
+        self.total += 1
+        if self.pattern is None or not description:
+            return None
+        matches = [int(match.lastgroup[1:]) for match in self.pattern.finditer(str(description).lower())]
+        if not matches:
+            return None
+        index = min(matches)
+        self.matched += 1
+        self.rule_hits[index] += 1
+        return self.rules[index]["category"], self.rules[index]["source"]
+
+    def stats(self):
+        """Counts over the descriptions passed to classify().
+
+        groqparser only passes the rows the categorization cache missed, so
+        total is the cache's misses, not every row.
+        """
+        return {
+            "matched": self.matched,
+            "total": self.total,
+            "short_circuit_rate": self.matched / self.total if self.total else 0.0,
+        }
@@ -1,15 +1,34 @@
 # main.py
 
+import os
+import sys
 import newparser
 import pdfextractor
 import groqparser
 import calculating_balances
+from pipeline import Pipeline, Stage
 
-def run_all_parsers():
-    newparser.main()
-    pdfextractor.main()
-    groqparser.main()
-    calculating_balances.main()
+RAW_STORE = os.path.join("processed_files", "store", "raw")
+CATEGORIZED_STORE = os.path.join("processed_files", "store", "categorized")
+
+# newparser and pdfextractor only read client_docs, so they run side by side;
+# groqparser waits for both and calculating_balances for groqparser
+STAGES = [
+    Stage("newparser", newparser.main, inputs=["client_docs"], outputs=[RAW_STORE]),
+    Stage("pdfextractor", pdfextractor.main, inputs=["client_docs"], outputs=[RAW_STORE]),
+    Stage("groqparser", groqparser.main, inputs=[RAW_STORE, "classification_rules.json"], outputs=[CATEGORIZED_STORE, "ollamaa/categorized_data.xlsx"]),
+    # Without an account_balances.json the balances are typed in, so the stage needs the terminal
+    Stage(
+        "calculating_balances", calculating_balances.main,
+        inputs=[CATEGORIZED_STORE, calculating_balances.DEFAULT_BALANCES_PATH],
+        outputs=["ollamaa/categorized_data.xlsx"],
+        interactive=not os.path.exists(calculating_balances.DEFAULT_BALANCES_PATH),
+    ),
+]
+
+def run_all_parsers(force=False):
+    Pipeline(STAGES).run(force=force)
 
 if __name__ == "__main__":
-    run_all_parsers()
+    # --force runs every stage even when its inputs are unchanged
+    run_all_parsers(force="--force" in sys.argv)
@@ -1,14 +1,21 @@
+import sys
 print("Starting main.py")
 import ollamaa.search as search
 print("Imported search")
 import ollamaa.chatbot as chatbot
 print("Imported chatbot")
+import ollamaa.chat_server as chat_server
 
-def run_all():
+def run_all(argv=()):
     print("Running search")
     search.main()
+    if "--serve" in argv:
+        # Everyone shares one server instead of each running their own chatbot
+        print("Running chat server")
+        chat_server.main([arg for arg in argv if arg != "--serve"])
+        return
     print("Running chatbot")
     chatbot.main()
 
 if __name__ == "__main__":
-    run_all()
\ No newline at end of file
+    run_all(sys.argv[1:])
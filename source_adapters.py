@@ -0,0 +1,192 @@
+import csv
+import logging
+import os
+import numpy as np
+import pandas as pd
+from date_parser import ColumnDateParser
+
+# Every CSV/TXT file is normalized to these columns before it is written
+TRANSACTION_COLUMNS = ['Date', 'Description', 'Amount', 'Category']
+
+# Exports such as Venmo's put a title block above the header; look this far down for it
+HEADER_SEARCH_LINES = 20
+
+# How each export marks a debit: "($85.57)", "-23.95" or "- $5.00"
+NEGATIVE_PATTERNS = {
+    'parentheses': r'^\(',
+    'minus': r'^-',
+    'either': r'^[(-]',
+}
+
+try:
+    import pyarrow  # noqa: F401
+    CSV_ENGINE = 'pyarrow'
+except ImportError:
+    CSV_ENGINE = 'c'
+
+# Below this size the C parser is faster: pyarrow's setup and the conversion of its
+# table to pandas cost more than it saves on a bank export of a few thousand rows
+PYARROW_MIN_BYTES = 512 * 1024
+
+def csv_engine(file_path):
+    """The parser for one CSV: pyarrow for large files when it is installed, the C parser otherwise."""
+    if CSV_ENGINE == 'pyarrow' and os.path.getsize(file_path) >= PYARROW_MIN_BYTES:
+        return 'pyarrow'
+    return 'c'
+
+def parse_amounts(values, sign='minus'):
+    """Convert amount strings like '($85.57)', '- $5.00' or '$1,350.00' to signed floats."""
+    strings = values.fillna('').astype(str).str.lstrip()
+    negative = strings.str.contains(NEGATIVE_PATTERNS[sign], regex=True).to_numpy()
+    magnitude = pd.to_numeric(strings.str.replace(r'[^0-9.]', '', regex=True), errors='coerce')
+    return magnitude * np.where(negative, -1, 1)
+
+def normalize_dates(values, date_format=None):
+    """Parse a column of date strings into datetime64 days, trying the whole column with date_format first.
+
+    Dates stay datetime64 in the store; they are written as MM/DD/YYYY text
+    only when a dataset is exported to Excel. Values no known format matches
+    become NaT.
+    """
+    values = values.fillna('').astype(str).str.strip()
+    if date_format:
+        parsed = pd.to_datetime(values, format=date_format, errors='coerce')
+    else:
+        parsed = pd.Series(pd.NaT, index=values.index, dtype='datetime64[ns]')
+    # Anything the declared format missed goes through the format-sniffing parser
+    misses = parsed.isna()
+    if misses.any():
+        date_parser = ColumnDateParser()
+
+        def parse(value):
+            try:
+                return date_parser.parse(value)
+            except ValueError:
+                return pd.NaT
+
+        parsed[misses] = pd.to_datetime(values[misses].map(parse))
+        unparsed = int(parsed.isna().sum())
+        if unparsed:
+            logging.warning(f"{unparsed} dates not recognized, e.g. {values[parsed.isna()].iloc[0]!r}")
+    # Only the day is kept, as the MM/DD/YYYY text did (Venmo's Datetime carries a time)
+    return parsed.dt.normalize()
+
+def normalize_transactions(data, date_format=None, sign='minus'):
+    """Map a frame with Date/Description/Amount columns onto TRANSACTION_COLUMNS."""
+    # Each column is converted once, as plain arrays, so a small export costs few pandas calls
+    dates = data['Date'].fillna('').astype(str).str.strip()
+    keep = (dates != '').to_numpy()
+    if not keep.all():
+        data, dates = data[keep], dates[keep]
+    return pd.DataFrame({
+        'Date': normalize_dates(dates, date_format).to_numpy(),
+        'Description': data['Description'].fillna('').astype(str).str.strip().to_numpy() if 'Description' in data else '',
+        'Amount': parse_amounts(data['Amount'], sign).to_numpy(),
+        'Category': 'Category_Value',
+    }, columns=TRANSACTION_COLUMNS)
+
+class SourceAdapter:
+    """Declarative description of one CSV export format.
+
+    A header row containing every name in `fingerprint` identifies the format.
+    `columns` maps Date/Description/Amount to that export's header names,
+    `date_format` is the strptime format of its date column and `sign` names
+    its debit convention in NEGATIVE_PATTERNS.
+    """
+
+    def __init__(self, name, fingerprint, columns, date_format=None, sign='minus'):
+        self.name = name
+        self.fingerprint = frozenset(fingerprint)
+        self.columns = columns
+        self.date_format = date_format
+        self.sign = sign
+
+    def matches(self, header):
+        return self.fingerprint <= {cell.strip() for cell in header}
+
+    def resolve_columns(self, header):
+        return self.columns
+
+class KeywordAdapter(SourceAdapter):
+    """Fallback for unknown exports: pick the first header containing each column's keyword."""
+
+    def __init__(self, name, keywords):
+        super().__init__(name, (), {}, sign='either')
+        self.keywords = keywords
+
+    def resolve_columns(self, header):
+        columns = {}
+        for column, keywords in self.keywords.items():
+            for keyword in keywords:
+                name = next((cell for cell in header if keyword in cell.lower()), None)
+                if name is not None:
+                    columns[column] = name
+                    break
+        return columns
+
+    def matches(self, header):
+        columns = self.resolve_columns(header)
+        return 'Date' in columns and 'Amount' in columns
+
+# Known exports, tried in order against each of the first HEADER_SEARCH_LINES lines
+ADAPTERS = [
+    SourceAdapter(
+        'amhfcu',
+        fingerprint=('Date', 'Description', 'Comments', 'Check Number', 'Amount', 'Balance'),
+        columns={'Date': 'Date', 'Description': 'Description', 'Amount': 'Amount'},
+        date_format='%m/%d/%Y',
+        sign='parentheses',
+    ),
+    SourceAdapter(
+        'upwork',
+        fingerprint=('Date', 'Ref ID', 'Type', 'Description', 'Amount', 'Amount in local currency'),
+        columns={'Date': 'Date', 'Description': 'Description', 'Amount': 'Amount'},
+        date_format='%b %d, %Y',
+    ),
+    SourceAdapter(
+        'venmo',
+        fingerprint=('ID', 'Datetime', 'Note', 'From', 'To', 'Amount (total)'),
+        columns={'Date': 'Datetime', 'Description': 'Note', 'Amount': 'Amount (total)'},
+        date_format='%Y-%m-%dT%H:%M:%S',
+    ),
+]
+
+FALLBACK_ADAPTER = KeywordAdapter('keywords', {
+    'Date': ('date',),
+    'Description': ('description', 'note'),
+    'Amount': ('amount',),
+})
+
+def detect_adapter(file_path, adapters=None):
+    """Return (adapter, header line index, {column: header name}) for a CSV, or (None, None, {})."""
+    adapters = ADAPTERS if adapters is None else adapters
+    with open(file_path, newline='', encoding='utf-8-sig') as csv_file:
+        lines = [header for _, header in zip(range(HEADER_SEARCH_LINES), csv.reader(csv_file))]
+    # A known fingerprint anywhere in the search window beats a keyword guess on an earlier line
+    for adapter in list(adapters) + [FALLBACK_ADAPTER]:
+        for line_index, header in enumerate(lines):
+            if adapter.matches(header):
+                return adapter, line_index, adapter.resolve_columns(header)
+    return None, None, {}
+
+def read_transactions_csv(file_path, adapters=None):
+    """Read only the transaction columns of a CSV export, every one as a string, and normalize them."""
+    adapter, header_line, columns = detect_adapter(file_path, adapters)
+    if adapter is None:
+        logging.warning(f"No date and amount columns found in file: {file_path}")
+        return pd.DataFrame(columns=TRANSACTION_COLUMNS)
+    logging.info(f"Reading {file_path} as a {adapter.name} export")
+
+    options = dict(header=header_line, usecols=list(columns.values()), dtype={name: str for name in columns.values()})
+    engine = csv_engine(file_path)
+    try:
+        data = pd.read_csv(file_path, engine=engine, **options)
+    except Exception as e:
+        if engine == 'c':
+            raise
+        # pyarrow rejects some quirks (e.g. line breaks inside quoted cells); the C parser copes with them
+        logging.info(f"pyarrow could not read {file_path} ({e}); falling back to the C parser")
+        data = pd.read_csv(file_path, engine='c', **options)
+
+    data = data.rename(columns={name: column for column, name in columns.items()})
+    return normalize_transactions(data, adapter.date_format, adapter.sign)
@@ -0,0 +1,215 @@
+import os
+import sys
+import logging
+from urllib.parse import quote, unquote
+import pandas as pd
+from date_parser import OUTPUT_FORMAT
+
+DEFAULT_STORE_PATH = os.path.join("processed_files", "store")
+
+# Extracted rows land in RAW; groqparser reads them and writes CATEGORIZED, one partition per category
+RAW = "raw"
+CATEGORIZED = "categorized"
+
+# Columns of the rows pdfextractor and ai_pdf_extractor add to RAW through a StoreSink
+DEFAULT_HEADER = ("Date", "Description", "Amount", "Category")
+
+class TransactionStore:
+    """Partitioned Parquet storage for the transactions passed between pipeline stages.
+
+    Each dataset is a directory holding one Parquet file per partition (a source
+    sheet or a category), so a stage rewrites only the partitions it produced and
+    readers load only the columns and partitions they ask for. Files are
+    memory-mapped on read. Excel workbooks are produced from here by
+    export_excel() at the end of the pipeline.
+    """
+
+    def __init__(self, root=DEFAULT_STORE_PATH):
+        self.root = root
+
+    def _path(self, dataset, partition):
+        # Sheet names may contain spaces, slashes and brackets; keep them readable but file-safe
+        return os.path.join(self.root, dataset, quote(partition, safe=" ()-_,") + ".parquet")
+
+    def exists(self, dataset):
+        return os.path.isdir(os.path.join(self.root, dataset))
+
+    def partitions(self, dataset):
+        directory = os.path.join(self.root, dataset)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(unquote(name[:-len(".parquet")]) for name in os.listdir(directory) if name.endswith(".parquet"))
+
+    def write(self, dataset, partition, frame):
+        """Replace one partition. The file is swapped in atomically so concurrent readers never see half of it."""
+        path = self._path(dataset, partition)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+        frame.to_parquet(temporary_path, index=False)
+        os.replace(temporary_path, path)
+
+    def remove(self, dataset, partition):
+        path = self._path(dataset, partition)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def columns(self, dataset, partition):
+        """Column names of a partition, read from the Parquet footer without loading any rows."""
+        import pyarrow.parquet as pq
+        return pq.read_schema(self._path(dataset, partition)).names
+
+    def row_count(self, dataset):
+        """Rows across all partitions of a dataset, read from the Parquet footers."""
+        import pyarrow.parquet as pq
+        return sum(pq.read_metadata(self._path(dataset, partition)).num_rows for partition in self.partitions(dataset))
+
+    def read_partition(self, dataset, partition, columns=None):
+        """Read one partition, or None if it does not exist."""
+        path = self._path(dataset, partition)
+        if not os.path.exists(path):
+            return None
+        return pd.read_parquet(path, columns=columns, memory_map=True)
+
+    def read(self, dataset, columns=None, partitions=None):
+        """Read partitions of a dataset into one frame with a 'partition' column."""
+        frames = []
+        for partition in self.partitions(dataset) if partitions is None else partitions:
+            frame = self.read_partition(dataset, partition, columns)
+            if frame is not None:
+                frames.append(frame.assign(partition=partition))
+        if not frames:
+            return pd.DataFrame(columns=list(columns or []) + ["partition"])
+        return pd.concat(frames, ignore_index=True)
+
+    def export_excel(self, dataset, file_name, partitions=None):
+        """Write every partition of a dataset to its own sheet of a new workbook.
+
+        Date columns stored as datetime64 are written as MM/DD/YYYY text, the
+        form every other sheet uses. Sheet names are cut to Excel's 31
+        characters, with a numbered suffix when two partitions would share one.
+        """
+        partitions = self.partitions(dataset) if partitions is None else partitions
+        os.makedirs(os.path.dirname(file_name) or ".", exist_ok=True)
+        titles = set()
+        with pd.ExcelWriter(file_name) as writer:
+            for partition in partitions:
+                frame = self.read_partition(dataset, partition)
+                if frame is not None:
+                    for column in frame.select_dtypes(include="datetime").columns:
+                        frame[column] = frame[column].dt.strftime(OUTPUT_FORMAT)
+                    frame.to_excel(writer, sheet_name=_sheet_title(partition, titles), index=False)
+        logging.info("Exported %d %s partitions to %s", len(partitions), dataset, file_name)
+
+def _sheet_title(partition, used):
+    # Excel sheet names are at most 31 characters and unique regardless of case
+    title = partition[:31]
+    number = 1
+    while title.lower() in used:
+        number += 1
+        suffix = f" ({number})"
+        title = partition[:31 - len(suffix)] + suffix
+    used.add(title.lower())
+    return title
+
+def _cell(value):
+    # Sink partitions hold strings so rows compare equal after a round trip through Parquet
+    return None if value is None else str(value)
+
+class StoreSink:
+    """Buffer rows per partition and write them to a TransactionStore.
+
+    Existing rows of a partition are read once, on first use. With dedupe on,
+    rows already stored are dropped with a set lookup.
+    Each touched partition is rewritten once per flush(). With replace on, the
+    dataset is rebuilt instead: partitions start empty rather than holding the
+    previous run's rows, and partitions not written this run are removed on
+    close().
+    """
+
+    def __init__(self, store, dataset, header=DEFAULT_HEADER, dedupe=True, flush_threshold=None, replace=False):
+        self.store = store
+        self.dataset = dataset
+        self.header = tuple(header)
+        self.dedupe = dedupe
+        self.replace = replace
+        self.flush_threshold = flush_threshold
+        self.rows = {}
+        self.seen = {}
+        self.dirty = set()
+        self.pending_count = 0
+        self.added = 0
+        self.duplicates = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+
+    def _load(self, partition):
+        if partition in self.rows:
+            return self.rows[partition]
+        frame = None if self.replace else self.store.read_partition(self.dataset, partition)
+        rows = []
+        if frame is not None:
+            frame = frame.astype(object).where(frame.notna(), None)
+            rows = [tuple(_cell(value) for value in row) for row in frame.itertuples(index=False, name=None)]
+        self.rows[partition] = rows
+        self.seen[partition] = set(rows)
+        return rows
+
+    def add(self, partition, rows):
+        stored = self._load(partition)
+        seen = self.seen[partition]
+        for row in rows:
+            row = tuple(_cell(value) for value in row)
+            if self.dedupe and row in seen:
+                self.duplicates += 1
+                continue
+            seen.add(row)
+            stored.append(row)
+            self.pending_count += 1
+            self.added += 1
+        self.dirty.add(partition)
+
+        if self.flush_threshold and self.pending_count >= self.flush_threshold:
+            self.flush()
+
+    def remove(self, partition, rows):
+        """Drop rows an earlier run wrote, e.g. because the file they came from has changed."""
+        stored = self._load(partition)
+        rows = {tuple(_cell(value) for value in row) for row in rows}
+        stored[:] = [row for row in stored if row not in rows]
+        self.seen[partition].difference_update(rows)
+        self.dirty.add(partition)
+
+    def flush(self):
+        for partition in sorted(self.dirty):
+            rows = self.rows[partition]
+            width = len(self.header)
+            rows = [row[:width] + (None,) * (width - len(row)) for row in rows]
+            self.store.write(self.dataset, partition, pd.DataFrame(rows, columns=list(self.header), dtype=object))
+            logging.info("Data written to %s/%s in %s", self.dataset, partition, self.store.root)
+        self.dirty = set()
+        self.pending_count = 0
+
+    def close(self):
+        self.flush()
+        # A run that wrote nothing at all (e.g. every model call failed) keeps the previous rows
+        if self.replace and self.rows:
+            for partition in self.store.partitions(self.dataset):
+                if partition not in self.rows:
+                    self.store.remove(self.dataset, partition)
+        if self.duplicates:
+            logging.info("Skipped %d duplicate rows for %s/%s", self.duplicates, self.store.root, self.dataset)
+
+def main():
+    # python transaction_store.py <dataset> <workbook.xlsx>
+    if len(sys.argv) != 3:
+        print("Usage: python transaction_store.py <dataset> <workbook.xlsx>")
+        return
+    TransactionStore().export_excel(sys.argv[1], sys.argv[2])
+
+if __name__ == "__main__":
+    main()